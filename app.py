@@ -1,10 +1,28 @@
 import os
 import io
-from flask import Flask, request, render_template, send_file, redirect, url_for, flash
+import re
+from flask import Flask, request, render_template, send_file, redirect, url_for, flash, jsonify
 from pptx import Presentation
-from deep_translator import GoogleTranslator, DeeplTranslator
+import time
 import tempfile
 import logging
+import shutil
+import zipfile
+import threading
+import cProfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from translators import get_engine_name
+from translator_backends import get_backend
+from translation_memory import get_translation_memory
+from result_cache import get_result_cache
+from text_filter import get_text_filter_fingerprint
+from jobs import JobManager
+from package_writer import save_presentation
+from output_names import get_output_filename, get_output_zip_filename
+from streaming import should_stream, translate_streaming, analyze_streaming
+from pipeline import TRANSLATION_MODE, TEXT_EXTRACTOR, TRANSLATE_MASTERS, extract_slide_units, count_tables, analyze_units, modified_parts, translate_unique_texts, translate_incremental, apply_translations, restore_originals
+from metrics import metrics, timed_phase, record_phase, start_request_timings, get_request_timings, format_server_timing
 
 # ロギング設定
 logging.basicConfig(level=logging.INFO)
@@ -13,171 +31,420 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = "ppt_translator_secret_key"
 
-# DeepL APIキー（環境変数から取得する例）
-DEEPL_API_KEY = os.environ.get("DEEPL_API_KEY", "")
+# バックグラウンドの翻訳ジョブ
+job_manager = JobManager()
 
-# 翻訳関数（DeepL APIを使用）
-def translate_text_deepl(text, source_lang, target_lang):
-    if not text or text.strip() == "":
-        return text
+# 翻訳結果をメモリ上に保持する最大サイズ（バイト、超えた場合は一時ファイルに書き出す）
+OUTPUT_SPOOL_MAX_SIZE = int(os.environ.get("OUTPUT_SPOOL_MAX_SIZE", str(32 * 1024 * 1024)))
+
+# プロファイリングを許可するか（有効な場合、?profile=1を付けたリクエストだけcProfile/tracemallocの結果を保存）
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "pptx_profiles"))
+
+# 1回のリクエストで指定できる翻訳先言語の数
+MAX_TARGET_LANGUAGES = int(os.environ.get("MAX_TARGET_LANGUAGES", "5"))
+LANGUAGE_CODE_PATTERN = re.compile(r"^[A-Za-z]{2,3}(-[A-Za-z]{2,4})?$")
+
+# 差分翻訳（同じプレゼンテーションの改訂版では変更されたテキストだけを翻訳する）
+# フォームのdeck_idで同じプレゼンテーションを識別し、指定がない場合はファイル名を使う
+INCREMENTAL_TRANSLATION = os.environ.get("INCREMENTAL_TRANSLATION", "1") == "1"
+
+# 1回の翻訳で送信する文字数の上限（全言語の合計、0の場合は制限なし）
+MAX_TRANSLATION_CHARS = int(os.environ.get("MAX_TRANSLATION_CHARS", "0"))
+
+# PowerPointファイルの翻訳処理
+# progress_callbackには処理段階・処理済みスライド数・翻訳済みテキスト数などの辞書を渡す
+# translation_modeは"run"（テキスト実行ごと）または"paragraph"（段落ごと、省略時は環境変数TRANSLATION_MODE）
+# input_fileとoutputにはパスまたはファイルオブジェクトを指定できる
+# outputを省略した場合は一時ファイルに保存してそのパスを返す（削除は呼び出し側で行う）
+def translate_pptx(input_file, source_lang, target_lang, font_name=None, progress_callback=None, translation_mode=None, output=None, deck_key=None):
+    # 大きなプレゼンテーションはスライドを1枚ずつ処理してメモリ使用量を抑える（差分翻訳の場合も同様）
+    if TEXT_EXTRACTOR == "xml" and should_stream(input_file):
+        return translate_pptx_streaming(
+            input_file, source_lang, target_lang, font_name,
+            progress_callback=progress_callback, translation_mode=translation_mode, output=output, deck_key=deck_key,
+        )
+    outputs = translate_pptx_multi(
+        input_file, source_lang, [target_lang], font_name,
+        progress_callback=progress_callback, translation_mode=translation_mode, deck_key=deck_key,
+        outputs={target_lang: output} if output is not None else None,
+    )
+    return outputs[target_lang]
+
+# スライドを1枚ずつ読み込んで翻訳し、すぐに書き込む（プレゼンテーション全体を読み込まない）
+def translate_pptx_streaming(input_file, source_lang, target_lang, font_name=None, progress_callback=None, translation_mode=None, output=None, deck_key=None):
+    progress = {"stage": "load", "slides_done": 0, "slides_total": 0, "runs_translated": 0, "runs_total": 0, "runs_failed": 0,
+                "runs_fallback": 0, "units_skipped": 0, "chars_skipped": 0}
+    progress_lock = threading.Lock()
     
-    # 入力が確実に文字列型であることを確認
-    text = str(text).strip()
+    # 進捗を通知（コールバックが指定されている場合のみ）
+    def report_progress(**fields):
+        with progress_lock:
+            progress.update(fields)
+            if progress_callback:
+                progress_callback(dict(progress))
+    
+    # 保存先が指定されていない場合は一時ファイルに保存
+    if output is None:
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
+        temp_file.close()
+        output = temp_file.name
     
     try:
-        # DeepL APIキーが設定されている場合はDeepLを使用
-        if DEEPL_API_KEY:
-            translator = DeeplTranslator(api_key=DEEPL_API_KEY)
-            result = translator.translate(text, source=source_lang, target=target_lang)
-        else:
-            # APIキーがない場合はGoogleを使用
-            translator = GoogleTranslator(source=source_lang, target=target_lang)
-            result = translator.translate(text)
-        
-        # 結果が文字列型であることを確認
-        if result is None:
-            logger.warning(f"翻訳結果がNoneです。元のテキストを返します: {text}")
-            return text
-        
-        return str(result)
+        logger.info(f"スライドを1枚ずつ翻訳します: {input_file}")
+        translate_streaming(
+            input_file, output, source_lang, target_lang, font_name,
+            translation_mode=translation_mode or TRANSLATION_MODE, report_progress=report_progress, deck_key=deck_key,
+        )
+        report_progress(stage="save")
+        return output
     except Exception as e:
-        logger.error(f"翻訳エラー: {e}, テキスト: {text}")
-        return text  # エラーの場合は元のテキストを返す
+        logger.error(f"翻訳処理中にエラーが発生しました: {e}")
+        raise
 
-# PowerPointファイルの翻訳処理
-def translate_pptx(input_file, source_lang, target_lang, font_name=None):
+# 1回の読み込み・抽出で複数の言語に翻訳（言語ごとの翻訳は並行して実行）
+# outputsには{言語: 保存先}を指定し、省略した言語は一時ファイルに保存する
+# deck_keyを指定した場合は、同じキーの前回の翻訳結果を使い変更されたテキストだけを翻訳する
+# {言語: 保存先}を返す
+def translate_pptx_multi(input_file, source_lang, target_langs, font_name=None, progress_callback=None, translation_mode=None, outputs=None, deck_key=None):
+    outputs = dict(outputs or {})
+    progress = {"stage": "load", "slides_done": 0, "slides_total": 0, "runs_translated": 0, "runs_total": 0, "runs_failed": 0,
+                "runs_fallback": 0, "units_skipped": 0, "chars_skipped": 0}
+    progress_lock = threading.Lock()
+    
+    # 進捗を通知（コールバックが指定されている場合のみ）
+    def report_progress(**fields):
+        with progress_lock:
+            progress.update(fields)
+            if progress_callback:
+                progress_callback(dict(progress))
+    
     try:
         # プレゼンテーションの読み込み
         logger.info(f"プレゼンテーションを読み込み中: {input_file}")
-        prs = Presentation(input_file)
+        with timed_phase("parse"):
+            prs = Presentation(input_file)
         
         # スライド数のログ
         logger.info(f"スライド数: {len(prs.slides)}")
+        report_progress(stage="extract", slides_total=len(prs.slides))
         
-        # 各スライドを処理
-        for i, slide in enumerate(prs.slides):
-            logger.info(f"スライド {i+1} を処理中...（完了後は自動で保存されます）")
-            
-            # テキストフレームを持つすべての図形を処理
-            for shape in slide.shapes:
-                # テキストフレームがある場合
-                if hasattr(shape, "text_frame") and shape.text_frame:
-                    for paragraph in shape.text_frame.paragraphs:
-                        # 各テキスト実行を処理
-                        for run in paragraph.runs:
-                            if run.text and run.text.strip():
-                                # 翻訳
-                                original_text = run.text
-                                translated_text = translate_text_deepl(original_text, source_lang, target_lang)
-                                logger.debug(f"翻訳: '{original_text}' -> '{translated_text}'")
-                                run.text = translated_text
-                                
-                                # フォントを適用（選択されている場合）
-                                if font_name and hasattr(run, "font") and run.font:
-                                    run.font.name = font_name
-                
-                # 表がある場合
-                if hasattr(shape, "table"):
-                    try:
-                        for row in shape.table.rows:
-                            for cell in row.cells:
-                                if cell.text_frame:
-                                    for paragraph in cell.text_frame.paragraphs:
-                                        for run in paragraph.runs:
-                                            if run.text and run.text.strip():
-                                                # 翻訳
-                                                original_text = run.text
-                                                translated_text = translate_text_deepl(original_text, source_lang, target_lang)
-                                                logger.debug(f"表の翻訳: '{original_text}' -> '{translated_text}'")
-                                                run.text = translated_text
-                                                
-                                                # フォントを適用（選択されている場合）
-                                                if font_name and hasattr(run, "font") and run.font:
-                                                    run.font.name = font_name
-                    except Exception as table_e:
-                        logger.error(f"表の処理中にエラーが発生しました: {table_e}")
-        
-        # 翻訳済みプレゼンテーションを一時ファイルに保存
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
-        temp_file.close()  # 明示的にクローズしてからsave
+        # 1. 各スライドから翻訳対象のテキストを収集
+        units = []
+        seen_parts = set()
+        with timed_phase("extract"):
+            for i, slide in enumerate(prs.slides):
+                logger.info(f"スライド {i+1} を処理中...（完了後は自動で保存されます）")
+                units.extend(extract_slide_units(slide, i, translation_mode, seen_parts=seen_parts))
+                report_progress(slides_done=i + 1)
+        
+        # 2. 重複を除いたテキストだけをまとめて翻訳（複数の言語は並行して翻訳）
+        report_progress(stage="translate", runs_total=len(units) * len(target_langs))
+        translated_counts = {target_lang: 0 for target_lang in target_langs}
+        failed_counts = {target_lang: 0 for target_lang in target_langs}
+        fallback_counts = {target_lang: 0 for target_lang in target_langs}
+        skipped_counts = {target_lang: (0, 0) for target_lang in target_langs}
         
-        logger.info(f"翻訳済みプレゼンテーションを保存中: {temp_file.name}")
-        prs.save(temp_file.name)
+        def translate_language(target_lang):
+            def report_translated(done):
+                translated_counts[target_lang] = done
+                report_progress(runs_translated=sum(translated_counts.values()))
+            def report_failed(count):
+                failed_counts[target_lang] += count
+                report_progress(runs_failed=sum(failed_counts.values()))
+            def report_fallback(texts):
+                fallback_counts[target_lang] += len(texts)
+                report_progress(runs_fallback=sum(fallback_counts.values()))
+            def report_skipped(units_skipped, chars_skipped):
+                skipped_counts[target_lang] = (units_skipped, chars_skipped)
+                report_progress(units_skipped=sum(count for count, _ in skipped_counts.values()),
+                                chars_skipped=sum(chars for _, chars in skipped_counts.values()))
+            if deck_key:
+                translations, reuse = translate_incremental(
+                    units, source_lang, target_lang, deck_key,
+                    progress_callback=report_translated, error_callback=report_failed, skip_callback=report_skipped,
+                    fallback_callback=report_fallback,
+                )
+                if reuse:
+                    report_progress(**reuse)
+                return translations
+            return translate_unique_texts(
+                units, source_lang, target_lang,
+                progress_callback=report_translated, error_callback=report_failed, skip_callback=report_skipped,
+                fallback_callback=report_fallback,
+            )
         
-        return temp_file.name
+        with timed_phase("translate"):
+            if len(target_langs) == 1:
+                translations = {target_langs[0]: translate_language(target_langs[0])}
+            else:
+                with ThreadPoolExecutor(max_workers=len(target_langs), thread_name_prefix="language") as executor:
+                    translations = dict(zip(target_langs, executor.map(translate_language, target_langs)))
+        report_progress(stage="save", runs_translated=len(units) * len(target_langs))
+        
+        # 3. 言語ごとに翻訳結果を書き戻して保存し、次の言語のために元のテキストに戻す
+        changed_parts = modified_parts(units)
+        for n, target_lang in enumerate(target_langs):
+            if n > 0:
+                restore_originals(units)
+            with timed_phase("apply"):
+                apply_translations(units, translations[target_lang], font_name)
+            
+            # 保存先が指定されていない場合は一時ファイルに保存
+            output = outputs.get(target_lang)
+            if output is None:
+                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
+                temp_file.close()  # 明示的にクローズしてからsave
+                output = outputs[target_lang] = temp_file.name
+            
+            # 翻訳結果を書き戻したパーツだけを置き換え、画像・動画などはそのままコピーする
+            logger.info(f"翻訳済みプレゼンテーションを保存中: {output}")
+            with timed_phase("save"):
+                save_presentation(prs, input_file, output, changed_parts)
+        
+        return outputs
     except Exception as e:
         logger.error(f"翻訳処理中にエラーが発生しました: {e}")
         raise
 
+# 翻訳せずに、テキストの量と翻訳リクエスト数・所要時間の見積もりを返す（翻訳処理と同じ方法で抽出）
+def analyze_pptx(input_file, source_lang=None, target_langs=None, translation_mode=None):
+    with timed_phase("analyze"):
+        # ストリーミング処理で翻訳する大きなファイルは、全体を読み込まずにzipから直接集計する
+        if TEXT_EXTRACTOR == "xml" and should_stream(input_file):
+            return analyze_streaming(input_file, source_lang, target_langs, translation_mode or TRANSLATION_MODE)
+        prs = Presentation(input_file)
+        units = []
+        seen_parts = set()
+        tables = 0
+        for i, slide in enumerate(prs.slides):
+            units.extend(extract_slide_units(slide, i, translation_mode, seen_parts=seen_parts))
+            tables += count_tables(slide)
+        
+        analysis = analyze_units(units, source_lang, target_langs)
+        analysis["slides"] = len(prs.slides)
+        analysis["tables"] = tables
+    return analysis
+
+# 翻訳する文字数の上限を確認（超える場合・解析できない場合はエラーメッセージを返す）
+def check_translation_quota(form):
+    if not MAX_TRANSLATION_CHARS:
+        return None
+    stream = form["file"].stream
+    try:
+        analysis = analyze_pptx(stream, form["source_lang"], form["target_langs"])
+    except Exception as e:
+        return f'ファイルを解析できませんでした: {str(e)}'
+    finally:
+        stream.seek(0)
+    if analysis["estimated_chars"] > MAX_TRANSLATION_CHARS:
+        return f'翻訳する文字数（{analysis["estimated_chars"]}文字）が上限（{MAX_TRANSLATION_CHARS}文字）を超えています'
+    return None
+
+# 複数の言語の翻訳結果を1つのzipファイルにまとめて保存（zip内のファイル名は言語の接頭辞つき）
+def translate_pptx_zip(input_file, filename, source_lang, target_langs, output, font_name=None, progress_callback=None, translation_mode=None, deck_key=None):
+    buffers = {target_lang: tempfile.SpooledTemporaryFile(max_size=OUTPUT_SPOOL_MAX_SIZE, suffix=".pptx") for target_lang in target_langs}
+    try:
+        if TEXT_EXTRACTOR == "xml" and should_stream(input_file):
+            # 大きなプレゼンテーションは言語ごとに順にスライドを1枚ずつ処理する（メモリ使用量は言語数によらない）
+            # 翻訳に失敗したテキスト数・予備の翻訳先で翻訳したテキスト数は全言語の合計を通知する
+            failed_counts = {}
+            fallback_counts = {}
+            for n, target_lang in enumerate(target_langs):
+                def report_language_progress(progress, n=n, target_lang=target_lang):
+                    failed_counts[target_lang] = progress.get("runs_failed", 0)
+                    fallback_counts[target_lang] = progress.get("runs_fallback", 0)
+                    if progress_callback:
+                        progress_callback(dict(progress, languages_done=n, languages_total=len(target_langs),
+                                               runs_failed=sum(failed_counts.values()),
+                                               runs_fallback=sum(fallback_counts.values())))
+                translate_pptx_streaming(
+                    input_file, source_lang, target_lang, font_name, progress_callback=report_language_progress,
+                    translation_mode=translation_mode, output=buffers[target_lang], deck_key=deck_key,
+                )
+        else:
+            translate_pptx_multi(
+                input_file, source_lang, target_langs, font_name,
+                progress_callback=progress_callback, translation_mode=translation_mode, outputs=buffers, deck_key=deck_key,
+            )
+        # .pptxはすでに圧縮されているため、再圧縮せずに格納する
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as archive:
+            for target_lang, buffer in buffers.items():
+                buffer.seek(0)
+                with archive.open(get_output_filename(filename, target_lang), "w") as entry:
+                    shutil.copyfileobj(buffer, entry)
+        return output
+    finally:
+        for buffer in buffers.values():
+            buffer.close()
+
+# フォームからファイルと翻訳オプションを取得（エラーの場合はメッセージを返す）
+def parse_translation_form():
+    # ファイルが提供されているか確認
+    if 'file' not in request.files:
+        return None, 'ファイルがありません'
+        
+    file = request.files['file']
+    
+    # ファイル名が空でないことを確認
+    if file.filename == '':
+        return None, 'ファイルが選択されていません'
+        
+    # 有効なファイル拡張子を確認
+    if not file.filename.endswith('.pptx'):
+        return None, 'PowerPointファイル(.pptx)のみ対応しています'
+        
+    # 翻訳方向の取得
+    translation_direction = request.form.get('direction', 'ja-en')
+    source_lang, target_lang = translation_direction.split('-')
+    
+    # 複数の翻訳先言語（カンマ区切りまたは複数指定、指定がない場合は翻訳方向の翻訳先のみ）
+    target_langs = [lang.strip() for value in request.form.getlist('target_langs') for lang in value.split(',') if lang.strip()]
+    target_langs = [lang for lang in dict.fromkeys(target_langs) if lang != source_lang] or [target_lang]
+    if len(target_langs) > MAX_TARGET_LANGUAGES:
+        return None, f'翻訳先の言語は{MAX_TARGET_LANGUAGES}つまで指定できます'
+    if not all(LANGUAGE_CODE_PATTERN.match(lang) for lang in target_langs):
+        return None, '翻訳先の言語コードが正しくありません'
+    
+    # フォント選択の取得
+    font_name = request.form.get('font_name', '')
+    # 'default'が選択された場合はNoneに設定（フォント変更なし）
+    if font_name == 'default':
+        font_name = None
+        
+    logger.info(f"選択されたフォント: {font_name}")
+    
+    # 差分翻訳に使うプレゼンテーションの識別子
+    deck_key = None
+    if INCREMENTAL_TRANSLATION:
+        deck_key = request.form.get('deck_id', '').strip() or file.filename
+    
+    return {
+        "file": file,
+        "source_lang": source_lang,
+        "target_lang": target_langs[0],
+        "target_langs": target_langs,
+        "font_name": font_name,
+        "deck_key": deck_key,
+    }, None
+
+# ダウンロード時のファイル名とMIMEタイプ（翻訳先が複数の場合はzip）
+def get_download_info(filename, target_langs):
+    if len(target_langs) > 1:
+        return get_output_zip_filename(filename, target_langs), 'application/zip'
+    return get_output_filename(filename, target_langs[0]), 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+
+# 同じファイルを同じオプションで翻訳済みか確認（(キャッシュ, キー, 翻訳済みファイルのパス)を返す）
+# キーには翻訳結果が変わるすべての設定（翻訳単位・抽出方法・レイアウトとマスターの翻訳・翻訳エンジン・翻訳不要なテキストの判定）を含める
+def lookup_result_cache(form):
+    cache = get_result_cache()
+    if cache is None:
+        return None, None, None
+    key = cache.make_key(
+        form["file"].stream,
+        source_lang=form["source_lang"],
+        target_langs=form["target_langs"],
+        font_name=form["font_name"],
+        translation_mode=TRANSLATION_MODE,
+        extractor=TEXT_EXTRACTOR,
+        translate_masters=TRANSLATE_MASTERS,
+        engine=get_engine_name(),
+        text_filter=get_text_filter_fingerprint(),
+    )
+    cached_path = cache.get(key)
+    metrics.inc("result_cache_hits_total" if cached_path else "result_cache_misses_total")
+    return cache, key, cached_path
+
+# 翻訳結果をキャッシュに登録（翻訳に失敗したテキスト・予備の翻訳先で翻訳したテキストがある場合は登録しない）
+def store_result_cache(cache, key, output, progress):
+    if cache is None:
+        return
+    if progress.get("runs_failed"):
+        logger.warning(f"翻訳に失敗したテキストがあるためキャッシュに登録しません: {progress['runs_failed']}件")
+        return
+    if progress.get("runs_fallback"):
+        logger.warning(f"予備の翻訳先で翻訳したテキストがあるためキャッシュに登録しません: {progress['runs_fallback']}件")
+        return
+    try:
+        cache.put(key, output)
+    except Exception as e:
+        logger.error(f"翻訳済みファイルをキャッシュに登録できませんでした: {e}")
+
 # Webインターフェース
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
-        # ファイルが提供されているか確認
-        if 'file' not in request.files:
-            flash('ファイルがありません')
+        with timed_phase("upload"):
+            form, error_message = parse_translation_form()
+        if error_message:
+            flash(error_message)
             return redirect(request.url)
             
-        file = request.files['file']
+        file = form["file"]
+        source_lang = form["source_lang"]
+        target_lang = form["target_lang"]
+        target_langs = form["target_langs"]
+        font_name = form["font_name"]
+        deck_key = form["deck_key"]
+        output_filename, mimetype = get_download_info(file.filename, target_langs)
         
-        # ファイル名が空でないことを確認
-        if file.filename == '':
-            flash('ファイルが選択されていません')
-            return redirect(request.url)
-            
-        # 有効なファイル拡張子を確認
-        if not file.filename.endswith('.pptx'):
-            flash('PowerPointファイル(.pptx)のみ対応しています')
+        # 同じファイルを同じオプションで翻訳済みの場合は、読み込み・翻訳をせずに前回の結果を返す
+        cache, cache_key, cached_path = lookup_result_cache(form)
+        if cached_path:
+            logger.info(f"キャッシュから翻訳済みファイルを返します: {output_filename}")
+            response = send_file(cached_path,
+                            as_attachment=True,
+                            download_name=output_filename,
+                            mimetype=mimetype)
+            response.headers["X-Translation-Complete"] = "true"
+            response.headers["X-Result-Cache"] = "hit"
+            return response
+        
+        # 文字数の上限を超える場合は翻訳しない
+        error_message = check_translation_quota(form)
+        if error_message:
+            flash(error_message)
             return redirect(request.url)
-            
-        # 翻訳方向の取得
-        translation_direction = request.form.get('direction', 'ja-en')
-        source_lang, target_lang = translation_direction.split('-')
-        
-        # フォント選択の取得
-        font_name = request.form.get('font_name', '')
-        # 'default'が選択された場合はNoneに設定（フォント変更なし）
-        if font_name == 'default':
-            font_name = None
-            
-        logger.info(f"選択されたフォント: {font_name}")
         
+        # 翻訳結果はメモリ上に保存し、OUTPUT_SPOOL_MAX_SIZEを超えた場合のみディスクに書き出す
+        output_buffer = tempfile.SpooledTemporaryFile(max_size=OUTPUT_SPOOL_MAX_SIZE, suffix=".pptx")
         try:
-            # 一時ファイルに保存
-            input_temp = tempfile.NamedTemporaryFile(delete=False, suffix=".pptx")
-            input_temp_path = input_temp.name
-            input_temp.close()
-            
-            file.save(input_temp_path)
-            logger.info(f"アップロードされたファイルを保存しました: {input_temp_path}")
-            
-            # 翻訳処理（フォント名も渡す）
-            output_file = translate_pptx(input_temp_path, source_lang, target_lang, font_name)
-            
-            # 一時入力ファイルの削除
-            try:
-                os.unlink(input_temp_path)
-                logger.info(f"一時ファイルを削除しました: {input_temp_path}")
-            except Exception as unlink_e:
-                logger.warning(f"一時ファイルの削除に失敗しました: {unlink_e}")
-            
-            # 出力ファイル名の設定
-            language_prefix = "en" if target_lang == "en" else "ja"
-            output_filename = f"{language_prefix}_{file.filename}"
+            # アップロードされたファイルをそのまま読み込んで翻訳処理（フォント名も渡す）
+            # 翻訳先が複数の場合は1回の読み込みで全言語に翻訳し、zipにまとめて返す
+            progress = {}
+            if len(target_langs) > 1:
+                translate_pptx_zip(file.stream, file.filename, source_lang, target_langs, output_buffer, font_name,
+                                   progress_callback=progress.update, deck_key=deck_key)
+            else:
+                translate_pptx(file.stream, source_lang, target_lang, font_name, output=output_buffer,
+                               progress_callback=progress.update, deck_key=deck_key)
+            store_result_cache(cache, cache_key, output_buffer, progress)
+            output_buffer.seek(0)
 
-            logger.info(f"翻訳済みファイルを返します: {output_file} -> {output_filename}")
+            logger.info(f"翻訳済みファイルを返します: {output_filename}")
 
             # ファイルを返す際に、特別なヘッダーを設定
-            response = send_file(output_file, 
+            # （バッファは送信完了後に閉じられ、ディスクに書き出した分も削除される）
+            response = send_file(output_buffer, 
                             as_attachment=True,
                             download_name=output_filename,
-                            mimetype='application/vnd.openxmlformats-officedocument.presentationml.presentation')
+                            mimetype=mimetype)
+            # send_fileの応答はそのままではcall_on_closeが呼ばれないため、通常の応答として送信する
+            response.direct_passthrough = False
+            response.call_on_close(output_buffer.close)
+            
+            # 送信にかかった時間を記録（送信完了後に計測するためServer-Timingには含まれない）
+            send_started = time.perf_counter()
+            response.call_on_close(lambda: record_phase("send", time.perf_counter() - send_started))
 
             # カスタムヘッダーを追加（これをJavaScriptで検知する）
             response.headers["X-Translation-Complete"] = "true"
+            # 翻訳に失敗して元のテキストのまま残したテキスト数
+            response.headers["X-Translation-Failed-Texts"] = str(progress.get("runs_failed", 0))
             return response
                             
         except Exception as e:
+            output_buffer.close()
             error_message = f'エラーが発生しました: {str(e)}'
             flash(error_message)
             logger.error(f"処理エラー: {e}")
@@ -185,6 +452,177 @@ def index():
             
     return render_template('index.html')
 
+# 翻訳ジョブの登録（すぐにジョブIDを返し、翻訳はバックグラウンドで実行）
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    form, error_message = parse_translation_form()
+    if error_message:
+        return jsonify({"error": error_message}), 400
+    
+    source_lang = form["source_lang"]
+    target_lang = form["target_lang"]
+    target_langs = form["target_langs"]
+    font_name = form["font_name"]
+    deck_key = form["deck_key"]
+    filename = form["file"].filename
+    cache, cache_key, cached_path = lookup_result_cache(form)
+    
+    # 文字数の上限を超える場合は登録しない
+    if not cached_path:
+        error_message = check_translation_quota(form)
+        if error_message:
+            return jsonify({"error": error_message}), 413
+    
+    job = job_manager.create(
+        form["file"],
+        filename,
+        output_name="output.zip" if len(target_langs) > 1 else "output.pptx",
+        source_lang=source_lang,
+        target_lang=target_lang,
+        target_langs=target_langs,
+        font_name=font_name,
+    )
+    
+    def run(input_path, output_path, progress_callback):
+        progress = {}
+        
+        def report_progress(fields):
+            progress.update(fields)
+            progress_callback(fields)
+        
+        # 翻訳先が複数の場合は全言語の翻訳結果をzipにまとめる
+        if len(target_langs) > 1:
+            translate_pptx_zip(
+                input_path, filename, source_lang, target_langs, output_path, font_name,
+                progress_callback=report_progress, deck_key=deck_key,
+            )
+        else:
+            translate_pptx(
+                input_path, source_lang, target_lang, font_name,
+                progress_callback=report_progress, output=output_path, deck_key=deck_key,
+            )
+        store_result_cache(cache, cache_key, output_path, progress)
+        # 翻訳に失敗したテキストがある場合は、ジョブの状態で知らせる
+        if progress.get("runs_failed"):
+            progress_callback({"warning": f'翻訳に失敗した{progress["runs_failed"]}件のテキストは元のまま残しています'})
+    
+    # 同じファイルを同じオプションで翻訳済みの場合は、前回の結果ですぐにジョブを完了する
+    if cached_path:
+        job_manager.complete_with_file(job, cached_path)
+        logger.info(f"キャッシュから翻訳ジョブを完了しました: {job['id']}")
+    else:
+        job_manager.submit(job, run)
+        logger.info(f"翻訳ジョブを登録しました: {job['id']}")
+    
+    return jsonify({
+        "job_id": job["id"],
+        "status_url": url_for('job_status', job_id=job["id"]),
+        "download_url": url_for('job_download', job_id=job["id"]),
+    }), 202
+
+# 翻訳せずにテキストの量と翻訳の見積もりを返す（大きなファイルの事前チェック用）
+@app.route('/analyze', methods=['POST'])
+def analyze():
+    form, error_message = parse_translation_form()
+    if error_message:
+        return jsonify({"error": error_message}), 400
+    
+    try:
+        analysis = analyze_pptx(form["file"].stream, form["source_lang"], form["target_langs"])
+    except Exception as e:
+        logger.error(f"解析エラー: {e}")
+        return jsonify({"error": f'ファイルを解析できませんでした: {str(e)}'}), 400
+    
+    analysis["max_chars"] = MAX_TRANSLATION_CHARS or None
+    analysis["within_quota"] = not MAX_TRANSLATION_CHARS or analysis["estimated_chars"] <= MAX_TRANSLATION_CHARS
+    return jsonify(analysis)
+
+# 翻訳ジョブの状態と進捗
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    return jsonify(job)
+
+# 翻訳済みファイルのダウンロード
+@app.route('/jobs/<job_id>/download')
+def job_download(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "ジョブが見つかりません"}), 404
+    
+    output_file = job_manager.output_path(job_id)
+    if output_file is None:
+        return jsonify({"error": "翻訳が完了していません", "status": job["status"]}), 409
+    
+    target_langs = job["options"].get("target_langs") or [job["options"]["target_lang"]]
+    download_name, mimetype = get_download_info(job["filename"], target_langs)
+    
+    response = send_file(output_file,
+                    as_attachment=True,
+                    download_name=download_name,
+                    mimetype=mimetype)
+    response.headers["X-Translation-Complete"] = "true"
+    return response
+
+# リクエストごとの処理時間の計測とプロファイリングの開始
+@app.before_request
+def start_request_instrumentation():
+    start_request_timings()
+    if PROFILING_ENABLED and request.args.get('profile') == '1':
+        profiler = cProfile.Profile()
+        request.environ['pptx.profiler'] = profiler
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            request.environ['pptx.tracemalloc'] = True
+        profiler.enable()
+
+# 処理段階ごとの所要時間をServer-Timingヘッダーで返し、プロファイリング結果を保存
+@app.after_request
+def finish_request_instrumentation(response):
+    timings = get_request_timings()
+    if timings:
+        response.headers["Server-Timing"] = format_server_timing(timings)
+    
+    profiler = request.environ.pop('pptx.profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base_name = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{request.endpoint}")
+        profiler.dump_stats(f"{base_name}.prof")
+        if request.environ.pop('pptx.tracemalloc', False):
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(f"{base_name}.tracemalloc.txt", "w", encoding="utf-8") as f:
+                f.write(f"current={current} peak={peak}\n")
+                for stat in snapshot.statistics("lineno")[:50]:
+                    f.write(f"{stat}\n")
+        logger.info(f"プロファイリング結果を保存しました: {base_name}.prof")
+        response.headers["X-Profile-Output"] = os.path.basename(base_name)
+    return response
+
+# Prometheus形式のメトリクス（このワーカープロセスの値）
+@app.route('/metrics')
+def metrics_endpoint():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# 翻訳メモリのヒット数・ミス数（全ワーカー共通）
+@app.route('/translation-memory/stats')
+def translation_memory_stats():
+    memory = get_translation_memory()
+    if memory is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(memory.stats(), enabled=True))
+
+# 翻訳先ごとの状態（failoverバックエンドの場合はサーキットブレーカーと同時リクエスト数の上限）
+@app.route('/translation-backend/status')
+def translation_backend_status():
+    backend = get_backend()
+    providers = backend.status() if hasattr(backend, "status") else {}
+    return jsonify({"backend": backend.name, "providers": providers})
+
 if __name__ == '__main__':
     # テンプレートディレクトリの作成
     os.makedirs('templates', exist_ok=True)
@@ -307,6 +745,14 @@ if __name__ == '__main__':
             margin-top: 20px;
         }
         
+        /* 進捗の表示 */
+        .loading-progress {
+            text-align: center;
+            color: white;
+            font-size: 18px;
+            margin-top: 10px;
+        }
+        
         /* フォントプレビュー用のスタイル */
         .font-preview {
             border: 1px solid #ddd;
@@ -354,6 +800,7 @@ if __name__ == '__main__':
     <div id="loading">
         <div class="spinner"></div>
         <div class="loading-text">翻訳処理中...（完了後は自動で保存されます。ブラウザのセキュリティ上保存しない際は直接ファイルを開いてください。）</div>
+        <div class="loading-progress" id="loadingProgress"></div>
     </div>
     
     <div class="container">
@@ -459,6 +906,57 @@ if __name__ == '__main__':
             updateFontPreview();
         });
     
+        // ジョブの進捗を表示用の文字列にする
+        function formatProgress(status) {
+            if (status.stage === 'translate' && status.runs_total > 0) {
+                const failed = status.runs_failed > 0 ? '（失敗 ' + status.runs_failed + ' 件）' : '';
+                return '翻訳中: ' + status.runs_translated + ' / ' + status.runs_total + ' テキスト' + failed;
+            }
+            if (status.stage === 'save') {
+                return '保存中...';
+            }
+            if (status.slides_total > 0) {
+                return 'スライドを読み込み中: ' + status.slides_done + ' / ' + status.slides_total;
+            }
+            return '処理待ち...';
+        }
+        
+        // エラーの応答から、サーバーが返したメッセージを取り出す（JSONでない場合は汎用のメッセージ）
+        function responseError(response) {
+            return response.json()
+                .then(body => new Error(body.error || 'サーバーエラーが発生しました'))
+                .catch(() => new Error('サーバーエラーが発生しました'))
+                .then(error => { throw error; });
+        }
+        
+        // ジョブが完了するまで進捗をポーリング
+        function waitForJob(job) {
+            return new Promise((resolve, reject) => {
+                function poll() {
+                    fetch(job.status_url)
+                    .then(response => {
+                        if (!response.ok) {
+                            return responseError(response);
+                        }
+                        return response.json();
+                    })
+                    .then(status => {
+                        if (status.status === 'done') {
+                            // 翻訳に失敗したテキストがある場合の注意（ダウンロード後に表示）
+                            resolve(Object.assign({}, job, {warning: status.warning}));
+                        } else if (status.status === 'error') {
+                            reject(new Error(status.error));
+                        } else {
+                            $('#loadingProgress').text(formatProgress(status));
+                            setTimeout(poll, 1000);
+                        }
+                    })
+                    .catch(reject);
+                }
+                poll();
+            });
+        }
+        
         $(document).ready(function() {
             // フォーム送信時の処理
             $('#translationForm').on('submit', function(e) {
@@ -477,15 +975,30 @@ if __name__ == '__main__':
                 // FormDataオブジェクトの作成
                 const formData = new FormData(this);
                 
-                // FetchAPIでフォームを送信
-                fetch('/', {
+                // 進捗表示の初期化
+                $('#loadingProgress').text('アップロード中...');
+                let warning = null;
+                
+                // 翻訳ジョブを登録
+                fetch('/jobs', {
                     method: 'POST',
                     body: formData
                 })
                 .then(response => {
-                    // エラーレスポンスの確認
+                    // エラーレスポンスの確認（文字数の上限を超えた場合などはサーバーのメッセージを表示する）
                     if (!response.ok) {
-                        throw new Error('サーバーエラーが発生しました');
+                        return responseError(response);
+                    }
+                    return response.json();
+                })
+                .then(job => waitForJob(job))
+                .then(job => {
+                    warning = job.warning;
+                    return fetch(job.download_url);
+                })
+                .then(response => {
+                    if (!response.ok) {
+                        return responseError(response);
                     }
                     
                     // 完了ヘッダーがあるか確認
@@ -517,18 +1030,22 @@ if __name__ == '__main__':
                     
                     // 成功メッセージ（オプション）
                     // alert('翻訳が完了しました。ダウンロードを開始します。');
+                    if (warning) {
+                        alert(warning);
+                    }
                 })
                 .catch(error => {
                     // エラー処理
                     $('#loading').hide();
                     console.error('Error:', error);
-                    alert('処理中にエラーが発生しました。しばらくしてからもう一度お試しください。');
+                    alert('処理中にエラーが発生しました: ' + (error.message || 'しばらくしてからもう一度お試しください。'));
                 });
             });
         });
     </script>
 </body>
 </html>
+        
         ''')
     
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 5001)))
\ No newline at end of file
@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from output_names import get_output_filename
+from translator_backends import SharedTokenBucket, use_rate_limiter, TRANSLATION_RATE_LIMIT, TRANSLATION_RATE_BURST
+
+logger = logging.getLogger(__name__)
+
+
+# 入力に指定されたファイルとディレクトリから.pptxを集める
+# （入力パス, 出力ディレクトリからの相対パス）のリストを返す
+def collect_inputs(paths):
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    # PowerPointが作るロックファイル（~$で始まる）は除く
+                    if name.lower().endswith(".pptx") and not name.startswith("~$"):
+                        input_path = os.path.join(root, name)
+                        inputs.append((input_path, os.path.relpath(input_path, path)))
+        elif os.path.isfile(path):
+            inputs.append((path, os.path.basename(path)))
+        else:
+            logger.warning(f"入力が見つかりません: {path}")
+    return inputs
+
+
+# 出力先のパス（入力ディレクトリ内の構成を保ち、ファイル名に言語の接頭辞をつける）
+def get_output_path(output_dir, relative_path, target_lang):
+    directory, filename = os.path.split(relative_path)
+    return os.path.join(output_dir, directory, get_output_filename(filename, target_lang))
+
+
+# プロセスプールの各ワーカーの初期化（翻訳のレート制限を全ワーカーで共有する）
+def _init_worker(limiter, verbose):
+    import app  # app側のログ設定を先に読み込む
+    logging.getLogger().setLevel(logging.INFO if verbose else logging.WARNING)
+    use_rate_limiter(limiter)
+
+
+# 1ファイルを翻訳し、処理段階ごとの所要時間を含む結果を返す（エラーの場合も例外を出さない）
+# deck_keyを指定した場合は前回の翻訳結果を使って差分だけを翻訳する
+def translate_deck(input_path, output_path, options, deck_key=None):
+    from app import translate_pptx
+    from metrics import start_request_timings
+
+    timings = start_request_timings()
+    start = time.perf_counter()
+    result = {"input": input_path, "output": output_path, "pid": os.getpid()}
+    # 途中で失敗した場合に壊れたファイルが残らないよう、一時ファイルに保存してから置き換える
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        translate_pptx(
+            input_path, options["source_lang"], options["target_lang"], options["font_name"],
+            translation_mode=options["translation_mode"], output=temp_path, deck_key=deck_key,
+        )
+        os.replace(temp_path, output_path)
+        result["status"] = "ok"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    result["phases"] = {phase: round(seconds, 3) for phase, seconds in timings.items()}
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PowerPointファイルをまとめて翻訳する")
+    parser.add_argument("inputs", nargs="+", help="翻訳する.pptxファイルまたはディレクトリ")
+    parser.add_argument("-o", "--output-dir", required=True, help="翻訳済みファイルの保存先")
+    parser.add_argument("--direction", choices=["ja-en", "en-ja"], default="ja-en")
+    parser.add_argument("--font-name", default=None)
+    parser.add_argument("--translation-mode", choices=["run", "paragraph"], default=None)
+    parser.add_argument("--incremental", action="store_true", help="入力からの相対パスが同じファイルは前回の翻訳結果を使い、変更されたテキストだけを翻訳する")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="同時に処理するファイル数（プロセス数）")
+    parser.add_argument("--report", help="結果のJSONの保存先（既定: 出力先のtranslation_report.json）")
+    parser.add_argument("--verbose", action="store_true", help="翻訳処理のログを表示する")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    source_lang, target_lang = args.direction.split("-")
+    options = {
+        "source_lang": source_lang,
+        "target_lang": target_lang,
+        "font_name": args.font_name,
+        "translation_mode": args.translation_mode,
+    }
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("翻訳する.pptxファイルがありません", file=sys.stderr)
+        return 1
+    tasks = [
+        (input_path, get_output_path(args.output_dir, relative_path, target_lang), relative_path if args.incremental else None)
+        for input_path, relative_path in inputs
+    ]
+
+    # 大きいファイルから順に投入し、最後に大きいファイルだけが残って待たされるのを防ぐ
+    order = sorted(range(len(tasks)), key=lambda i: os.path.getsize(tasks[i][0]), reverse=True)
+
+    context = multiprocessing.get_context()
+    limiter = SharedTokenBucket(TRANSLATION_RATE_LIMIT, TRANSLATION_RATE_BURST, context)
+    workers = max(1, min(args.workers, len(tasks)))
+    logger.info(f"{len(tasks)}件のファイルを{workers}プロセスで翻訳します")
+
+    results = [None] * len(tasks)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(limiter, args.verbose)) as executor:
+        futures = {executor.submit(translate_deck, tasks[i][0], tasks[i][1], options, tasks[i][2]): i for i in order}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # ワーカープロセスの異常終了など
+                result = {"input": tasks[i][0], "output": tasks[i][1], "status": "error", "error": str(e)}
+            results[i] = result
+            if result["status"] == "ok":
+                print(f"[{done}/{len(tasks)}] 完了 {result['seconds']}秒: {result['input']}", file=sys.stderr)
+            else:
+                print(f"[{done}/{len(tasks)}] エラー: {result['input']}: {result['error']}", file=sys.stderr)
+    wall_time = time.perf_counter() - start
+
+    failed = [result for result in results if result["status"] != "ok"]
+    summary = {
+        "files": len(results),
+        "succeeded": len(results) - len(failed),
+        "failed": len(failed),
+        "workers": workers,
+        "wall_time": round(wall_time, 3),
+        "total_deck_seconds": round(sum(result.get("seconds", 0) for result in results), 3),
+    }
+    report_path = args.report or os.path.join(args.output_dir, "translation_report.json")
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({"options": options, "summary": summary, "decks": results}, f, ensure_ascii=False, indent=2)
+
+    print(f"{summary['succeeded']}/{summary['files']}件を翻訳しました（{summary['wall_time']}秒）。結果: {report_path}", file=sys.stderr)
+    for result in failed:
+        print(f"失敗: {result['input']}: {result['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,274 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import resource
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+# ネットワークを使わずに計測するため、翻訳メモリとレート制限・再試行の待ち時間は既定で無効にする
+# 同じファイルを繰り返し翻訳するため、翻訳済みファイルのキャッシュと差分翻訳も無効にする
+os.environ.setdefault("TRANSLATION_MEMORY_PATH", "")
+os.environ.setdefault("RESULT_CACHE_DIR", "")
+os.environ.setdefault("REVISION_STORE_PATH", "")
+os.environ.setdefault("TRANSLATION_RATE_LIMIT", "0")
+os.environ.setdefault("TRANSLATION_RETRY_BASE_DELAY", "0.01")
+
+from pptx import Presentation
+from pptx.util import Inches, Pt
+from deep_translator.exceptions import TooManyRequests
+from translator_backends import MockBackend, use_backend
+
+# 生成するテキストに使う単語
+WORDS = [
+    "売上", "計画", "目標", "顧客", "市場", "製品", "開発", "戦略", "分析", "結果",
+    "課題", "対策", "予算", "品質", "改善", "報告", "会議", "資料", "効率", "成長",
+]
+
+
+# 合成テキストの生成（repetition_rateの割合で共通の文字列を使う）
+class TextGenerator:
+    def __init__(self, repetition_rate, seed=0, pool_size=30):
+        self.random = random.Random(seed)
+        self.repetition_rate = repetition_rate
+        self.pool = [self._new_text() for _ in range(pool_size)]
+
+    def _new_text(self):
+        return "".join(self.random.choice(WORDS) for _ in range(self.random.randint(2, 6)))
+
+    def text(self):
+        if self.random.random() < self.repetition_rate:
+            return self.random.choice(self.pool)
+        return self._new_text()
+
+
+# 指定したサイズの合成プレゼンテーションを生成してバイト列で返す
+def generate_deck(slides=50, shapes_per_slide=4, paragraphs_per_shape=3, runs_per_paragraph=2,
+                  tables_per_slide=1, table_size=(3, 3), repetition_rate=0.3, seed=0):
+    generator = TextGenerator(repetition_rate, seed)
+    prs = Presentation()
+    layout = prs.slide_layouts[6]  # 白紙
+    for _ in range(slides):
+        slide = prs.slides.add_slide(layout)
+        for n in range(shapes_per_slide):
+            textbox = slide.shapes.add_textbox(Inches(0.5), Inches(0.5 + n), Inches(6), Inches(1))
+            text_frame = textbox.text_frame
+            for p in range(paragraphs_per_shape):
+                paragraph = text_frame.paragraphs[0] if p == 0 else text_frame.add_paragraph()
+                for r in range(runs_per_paragraph):
+                    run = paragraph.add_run()
+                    run.text = generator.text()
+                    run.font.bold = r % 2 == 1
+        for n in range(tables_per_slide):
+            rows, cols = table_size
+            table = slide.shapes.add_table(rows, cols, Inches(6.5), Inches(0.5 + n * 2), Inches(3), Inches(1.5)).table
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = generator.text()
+                    cell.text_frame.paragraphs[0].runs[0].font.size = Pt(10)
+    buffer = io.BytesIO()
+    prs.save(buffer)
+    return buffer.getvalue()
+
+
+# 呼び出し回数と文字数を数え、指定した割合で429を返す代替バックエンド
+class FakeBackend(MockBackend):
+    name = "fake"
+
+    def __init__(self, latency=0.05, failure_rate=0.0):
+        super().__init__(latency)
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.chars = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def request(self, texts, source_lang, target_lang):
+        with self._lock:
+            self.calls += 1
+            self.chars += sum(len(text) for text in texts)
+        results = super().request(texts, source_lang, target_lang)
+        if self.failure_rate and random.random() < self.failure_rate:
+            with self._lock:
+                self.failures += 1
+            raise TooManyRequests()
+        return results
+
+
+def install_fake_backend(latency, failure_rate):
+    backend = FakeBackend(latency, failure_rate)
+    use_backend(backend)
+    return backend
+
+
+# プロセス全体のピークRSS（MB）
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOSはバイト、Linuxはキロバイト単位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+# translate_pptxを直接呼び出して計測
+def run_translate_pptx(deck, slides, options):
+    from app import translate_pptx
+
+    start = time.perf_counter()
+    for _ in range(options["iterations"]):
+        translate_pptx(io.BytesIO(deck), "ja", "en", options["font_name"], output=io.BytesIO(),
+                       translation_mode=options["translation_mode"])
+    return time.perf_counter() - start, options["iterations"] * slides, []
+
+
+# Flaskのindex()に複数スレッドから同時にアップロードして計測
+def run_flask_index(deck, slides, options):
+    from app import app
+
+    def upload(_):
+        client = app.test_client()
+        start = time.perf_counter()
+        response = client.post("/", data={
+            "file": (io.BytesIO(deck), "bench.pptx"),
+            "direction": "ja-en",
+            "font_name": options["font_name"] or "default",
+        })
+        response.get_data()
+        response.close()
+        if response.status_code != 200:
+            raise RuntimeError(f"index()が{response.status_code}を返しました")
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+        latencies = list(executor.map(upload, range(options["iterations"])))
+    return time.perf_counter() - start, options["iterations"] * slides, latencies
+
+
+SCENARIOS = {
+    "translate_pptx": run_translate_pptx,
+    "flask_index": run_flask_index,
+}
+
+
+# 1つのシナリオを実行して結果を返す（ピークRSSを分けて測るため別プロセスで呼び出す）
+def run_scenario(name, options):
+    # 翻訳処理のログは計測の妨げになるため警告以上のみ出力
+    import app  # app側のログ設定を先に読み込む
+    logging.getLogger().setLevel(logging.DEBUG if options.get("verbose") else logging.WARNING)
+
+    deck = generate_deck(
+        slides=options["slides"],
+        shapes_per_slide=options["shapes_per_slide"],
+        paragraphs_per_shape=options["paragraphs_per_shape"],
+        runs_per_paragraph=options["runs_per_paragraph"],
+        tables_per_slide=options["tables_per_slide"],
+        repetition_rate=options["repetition_rate"],
+        seed=options["seed"],
+    )
+    backend = install_fake_backend(options["latency"], options["failure_rate"])
+
+    wall_time, slides_done, latencies = SCENARIOS[name](deck, options["slides"], options)
+
+    result = {
+        "scenario": name,
+        "wall_time": round(wall_time, 3),
+        "calls": backend.calls,
+        "chars": backend.chars,
+        "failures": backend.failures,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "slides_per_second": round(slides_done / wall_time, 2) if wall_time else None,
+        "deck_bytes": len(deck),
+    }
+    if latencies:
+        latencies.sort()
+        result["latency_p50"] = round(latencies[len(latencies) // 2], 3)
+        result["latency_p95"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+    return result
+
+
+def _scenario_worker(name, options, queue):
+    try:
+        queue.put(run_scenario(name, options))
+    except Exception as e:
+        queue.put({"scenario": name, "error": str(e)})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PowerPoint翻訳のベンチマーク（ネットワーク不要）")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS) + ["all"], default="all")
+    parser.add_argument("--slides", type=int, default=50)
+    parser.add_argument("--shapes-per-slide", type=int, default=4)
+    parser.add_argument("--paragraphs-per-shape", type=int, default=3)
+    parser.add_argument("--runs-per-paragraph", type=int, default=2)
+    parser.add_argument("--tables-per-slide", type=int, default=1)
+    parser.add_argument("--repetition-rate", type=float, default=0.3, help="共通の文字列を使う割合 (0-1)")
+    parser.add_argument("--latency", type=float, default=0.05, help="翻訳1回あたりの待ち時間（秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="翻訳が429で失敗する割合 (0-1)")
+    parser.add_argument("--iterations", type=int, default=1, help="繰り返し回数（flask_indexではアップロード数）")
+    parser.add_argument("--concurrency", type=int, default=4, help="flask_indexの同時アップロード数")
+    parser.add_argument("--translation-mode", choices=["run", "paragraph"], default=None)
+    parser.add_argument("--font-name", default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="翻訳処理のログを表示する")
+    parser.add_argument("--json", dest="json_path", help="結果をJSONで保存するパス")
+    parser.add_argument("--max-wall-time", type=float, help="これを超えるシナリオがあれば終了コード1（CI用）")
+    parser.add_argument("--max-calls", type=int, help="翻訳呼び出し回数がこれを超えれば終了コード1（CI用）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    options = {
+        "slides": args.slides,
+        "shapes_per_slide": args.shapes_per_slide,
+        "paragraphs_per_shape": args.paragraphs_per_shape,
+        "runs_per_paragraph": args.runs_per_paragraph,
+        "tables_per_slide": args.tables_per_slide,
+        "repetition_rate": args.repetition_rate,
+        "latency": args.latency,
+        "failure_rate": args.failure_rate,
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "translation_mode": args.translation_mode,
+        "font_name": args.font_name,
+        "seed": args.seed,
+        "verbose": args.verbose,
+    }
+    names = sorted(SCENARIOS) if args.scenario == "all" else [args.scenario]
+
+    results = []
+    for name in names:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_scenario_worker, args=(name, options, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"options": options, "results": results}, f, ensure_ascii=False, indent=2)
+
+    # しきい値のチェック（CIで性能の劣化を検出する）
+    failed = False
+    for result in results:
+        if "error" in result:
+            print(f"{result['scenario']}: エラー: {result['error']}", file=sys.stderr)
+            failed = True
+            continue
+        if args.max_wall_time is not None and result["wall_time"] > args.max_wall_time:
+            print(f"{result['scenario']}: 実行時間 {result['wall_time']}秒 > {args.max_wall_time}秒", file=sys.stderr)
+            failed = True
+        if args.max_calls is not None and result["calls"] > args.max_calls:
+            print(f"{result['scenario']}: 翻訳呼び出し {result['calls']}回 > {args.max_calls}回", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# ジョブの入出力ファイルと状態を保存するディレクトリ（全ワーカーで共有）
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(tempfile.gettempdir(), "pptx_jobs"))
+# バックグラウンドで同時に実行するジョブ数
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+# 完了したジョブを保持する時間（秒）
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", "3600"))
+# 進捗をファイルに書き込む最小間隔（秒）
+JOB_PROGRESS_INTERVAL = 0.5
+# 待機中・実行中のジョブの更新日時を書き込む間隔（秒）
+JOB_HEARTBEAT_SECONDS = int(os.environ.get("JOB_HEARTBEAT_SECONDS", "30"))
+# 待機中・実行中のまま更新がないジョブをエラーとみなすまでの時間（秒、実行していたプロセスが停止した場合など）
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "300"))
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+# 翻訳ジョブの登録・実行・状態管理
+# 状態はJSONファイルに保存するため、どのgunicornワーカーからでも参照できる
+class JobManager:
+    def __init__(self, jobs_dir=JOBS_DIR, workers=JOB_WORKERS, ttl_seconds=JOB_TTL_SECONDS):
+        self.jobs_dir = jobs_dir
+        self.ttl_seconds = ttl_seconds
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._save_lock = threading.RLock()
+        self._active = {}  # このプロセスで待機中・実行中のジョブ
+        self._heartbeat = None
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def _state_path(self, job_id):
+        return os.path.join(self._job_dir(job_id), "job.json")
+
+    # 状態ファイルを一時ファイル経由で置き換える（読み込み中の破損を防ぐ）
+    def _save(self, job):
+        path = self._state_path(job["id"])
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._save_lock:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+
+    # ジョブの状態を取得（存在しない場合はNone）
+    # 待機中・実行中のまま更新が止まったジョブはエラーにする（保持期間の経過後に削除される）
+    def get(self, job_id):
+        if not JOB_ID_PATTERN.match(job_id or ""):
+            return None
+        try:
+            with open(self._state_path(job_id), encoding="utf-8") as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if job["status"] in ("queued", "running") and time.time() - job["updated_at"] > JOB_STALE_SECONDS:
+            job.update(status="error", error="ジョブを実行していたプロセスが停止したため中断しました", updated_at=time.time())
+            self._save(job)
+            logger.warning(f"更新が止まったジョブをエラーにしました: {job_id}")
+        return job
+
+    # ジョブを登録し、アップロードされたファイルを保存（output_nameはジョブディレクトリ内の出力ファイル名）
+    def create(self, upload, filename, output_name="output.pptx", **options):
+        self.cleanup_expired()
+
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._job_dir(job_id))
+        input_path = os.path.join(self._job_dir(job_id), "input.pptx")
+        upload.save(input_path)
+
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "filename": filename,
+            "output_name": output_name,
+            "options": options,
+            "stage": "queued",
+            "slides_done": 0,
+            "slides_total": 0,
+            "runs_translated": 0,
+            "runs_total": 0,
+            "runs_failed": 0,
+            "error": None,
+            "warning": None,
+            "created_at": time.time(),
+            "updated_at": time.time(),
+        }
+        self._save(job)
+        return job
+
+    # ジョブをバックグラウンドで実行（runは入力パス・出力パス・進捗コールバックを受け取る）
+    def submit(self, job, run):
+        with self._lock:
+            self._active[job["id"]] = job
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+                self._heartbeat.start()
+        self.executor.submit(self._run, job, run)
+
+    # このプロセスで待機中・実行中のジョブの更新日時を定期的に書き込む（プロセスが動いていることを示す）
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._lock:
+                jobs = list(self._active.values())
+            for job in jobs:
+                try:
+                    with self._save_lock:
+                        job["updated_at"] = time.time()
+                        self._save(job)
+                except OSError as e:
+                    logger.error(f"ジョブの状態を保存できませんでした: {job['id']}, {e}")
+
+    def _run(self, job, run):
+        job_id = job["id"]
+        input_path = os.path.join(self._job_dir(job_id), "input.pptx")
+        output_path = os.path.join(self._job_dir(job_id), job["output_name"])
+        last_saved = [0.0]
+
+        # 進捗を一定間隔でファイルに書き込む（処理段階が変わった場合はすぐに書き込む）
+        def progress_callback(progress):
+            with self._save_lock:
+                stage_changed = progress.get("stage") != job.get("stage")
+                job.update(progress)
+                job["updated_at"] = time.time()
+                if stage_changed or job["updated_at"] - last_saved[0] >= JOB_PROGRESS_INTERVAL:
+                    last_saved[0] = job["updated_at"]
+                    self._save(job)
+
+        job["status"] = "running"
+        self._save(job)
+        logger.info(f"ジョブを開始します: {job_id}")
+        try:
+            run(input_path, output_path, progress_callback)
+            job["status"] = "done"
+            job["stage"] = "done"
+            logger.info(f"ジョブが完了しました: {job_id}")
+        except Exception as e:
+            job["status"] = "error"
+            job["error"] = str(e)
+            logger.error(f"ジョブでエラーが発生しました: {job_id}, {e}")
+        finally:
+            try:
+                os.unlink(input_path)
+            except OSError:
+                pass
+            with self._lock:
+                self._active.pop(job_id, None)
+            job["updated_at"] = time.time()
+            self._save(job)
+
+    # 既存のファイル（翻訳済みファイルのキャッシュなど）を出力としてジョブをすぐに完了する
+    def complete_with_file(self, job, path):
+        job_dir = self._job_dir(job["id"])
+        shutil.copyfile(path, os.path.join(job_dir, job["output_name"]))
+        try:
+            os.unlink(os.path.join(job_dir, "input.pptx"))
+        except OSError:
+            pass
+        job.update(status="done", stage="done", updated_at=time.time())
+        self._save(job)
+
+    # 完了したジョブの出力ファイルのパス（未完了の場合はNone）
+    def output_path(self, job_id):
+        job = self.get(job_id)
+        if job is None or job["status"] != "done":
+            return None
+        return os.path.join(self._job_dir(job_id), job.get("output_name", "output.pptx"))
+
+    # 保持期間を過ぎたジョブを削除
+    def cleanup_expired(self):
+        now = time.time()
+        with self._lock:
+            for job_id in os.listdir(self.jobs_dir):
+                job = self.get(job_id)
+                if job is None:
+                    continue
+                if job["status"] in ("done", "error") and now - job["updated_at"] > self.ttl_seconds:
+                    shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+                    logger.info(f"期限切れのジョブを削除しました: {job_id}")
@@ -0,0 +1,140 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# 処理時間のヒストグラムの区切り（秒）
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# メトリクスの種類と説明
+METRICS = {
+    "pptx_phase_seconds": ("histogram", "処理段階ごとの所要時間（秒）"),
+    "translation_request_seconds": ("histogram", "翻訳APIへの1リクエストの所要時間（秒）"),
+    "translation_api_calls_total": ("counter", "翻訳APIへのリクエスト数"),
+    "translation_chars_total": ("counter", "翻訳APIに送信した文字数"),
+    "translation_retries_total": ("counter", "翻訳リクエストの再試行回数"),
+    "translation_errors_total": ("counter", "再試行しても失敗した翻訳リクエスト数"),
+    "translation_failovers_total": ("counter", "別の翻訳先に切り替えた回数"),
+    "translation_fallback_texts_total": ("counter", "予備の翻訳先で翻訳したテキスト数（翻訳メモリには登録しない）"),
+    "translation_hedged_requests_total": ("counter", "応答が遅いため別の翻訳先にも送信した回数"),
+    "translation_circuit_opened_total": ("counter", "失敗が続いたため翻訳先への送信を止めた回数"),
+    "translation_units_skipped_total": ("counter", "翻訳不要と判定しAPIに送らなかったテキスト数（重複を含む）"),
+    "translation_chars_skipped_total": ("counter", "翻訳不要と判定しAPIに送らなかった文字数"),
+    "translation_cache_hits_total": ("counter", "翻訳メモリのヒット数"),
+    "translation_cache_misses_total": ("counter", "翻訳メモリのミス数"),
+    "result_cache_hits_total": ("counter", "翻訳済みファイルのキャッシュのヒット数"),
+    "result_cache_misses_total": ("counter", "翻訳済みファイルのキャッシュのミス数"),
+    "translation_units_reused_total": ("counter", "前回の翻訳結果を再利用したテキスト数（差分翻訳）"),
+}
+
+
+# プロセス内のカウンタとヒストグラム（Prometheusのテキスト形式で出力する）
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    # カウンタを加算
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # ヒストグラムに値を記録
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    # ヒストグラムの合計値と件数
+    def summary(self, name, **labels):
+        with self._lock:
+            histogram = self._histograms.get((name, tuple(sorted(labels.items()))))
+            if histogram is None:
+                return 0.0, 0
+            return histogram["sum"], histogram["count"]
+
+    # Prometheusのテキスト形式で出力
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {**h, "buckets": list(h["buckets"])} for key, h in self._histograms.items()}
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == "counter":
+                samples = [(labels, value) for (n, labels), value in counters.items() if n == name]
+                if not samples:
+                    lines.append(f"{name} 0")
+                for labels, value in sorted(samples):
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            else:
+                for (n, labels), histogram in sorted(histograms.items()):
+                    if n != name:
+                        continue
+                    for bound, count in zip(DURATION_BUCKETS, histogram["buckets"]):
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+metrics = MetricsRegistry()
+
+# リクエストごとの処理段階別の所要時間（Server-Timingヘッダーに出力する）
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+# 現在のリクエストの計測を開始
+def start_request_timings():
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def get_request_timings():
+    return _request_timings.get()
+
+
+# 処理段階の所要時間を記録
+def record_phase(phase, seconds):
+    metrics.observe("pptx_phase_seconds", seconds, phase=phase)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+# withブロックの所要時間を処理段階として記録
+@contextmanager
+def timed_phase(phase):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(phase, time.perf_counter() - start)
+
+
+# Server-Timingヘッダーの値（例: "parse;dur=12.3, translate;dur=456.7"）
+def format_server_timing(timings):
+    return ", ".join(f"{phase};dur={seconds * 1000:.1f}" for phase, seconds in timings.items())
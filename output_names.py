@@ -0,0 +1,11 @@
+import os
+
+
+# 出力ファイル名の設定（翻訳先の言語の接頭辞をつける）
+def get_output_filename(filename, target_lang):
+    return f"{target_lang}_{filename}"
+
+
+# 複数言語の翻訳結果をまとめたzipファイル名
+def get_output_zip_filename(filename, target_langs):
+    return f"{os.path.splitext(filename)[0]}_{'_'.join(target_langs)}.zip"
@@ -0,0 +1,89 @@
+import os
+import copy
+import struct
+import zipfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 翻訳済みファイルの保存方法（"partial": 書き換えたパーツだけを置き換え、他のメンバーは圧縮されたままコピー
+# "full": python-pptxでパッケージ全体を保存し直す）
+PACKAGE_WRITER = os.environ.get("PACKAGE_WRITER", "partial")
+
+COPY_CHUNK_SIZE = 1024 * 1024
+LOCAL_FILE_HEADER_SIZE = 30
+
+
+# zipのメンバーを展開せずに、圧縮されたデータのまま別のzipにコピー
+def copy_member_raw(source, info, target):
+    # ローカルファイルヘッダーの後ろにあるデータの位置を求める
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(LOCAL_FILE_HEADER_SIZE)
+    if header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"ローカルファイルヘッダーが不正です: {info.filename}")
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    source.fp.seek(info.header_offset + LOCAL_FILE_HEADER_SIZE + name_length + extra_length)
+
+    # サイズとCRCはヘッダーに書くため、データ記述子は使わない
+    copied = copy.copy(info)
+    copied.flag_bits &= ~0x08
+    copied.extra = zipfile._strip_extra(info.extra, (1,))  # ZIP64の拡張フィールドは書き込み時に作り直される
+    copied.header_offset = target.fp.tell()
+    target.fp.write(copied.FileHeader())
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = source.fp.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"メンバーのデータが途中で終わっています: {info.filename}")
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+
+    target.filelist.append(copied)
+    target.NameToInfo[copied.filename] = copied
+    target.start_dir = target.fp.tell()
+    target._didModify = True
+
+
+# 入力のパッケージを元に、書き換えたパーツだけを置き換えて保存する
+# 画像・動画・フォントなど他のメンバーは展開せずにそのままコピーするため、保存時間は書き換えた量に比例する
+def save_partial(input_file, output, parts):
+    replacements = {part.partname.membername: part.blob for part in parts}
+    if hasattr(input_file, "seek"):
+        input_file.seek(0)
+    with zipfile.ZipFile(input_file) as source:
+        missing = set(replacements) - set(source.namelist())
+        if missing:
+            raise KeyError(f"入力に存在しないパーツがあります: {sorted(missing)}")
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as target:
+            for info in source.infolist():
+                if info.filename in replacements:
+                    replaced = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                    replaced.compress_type = zipfile.ZIP_DEFLATED
+                    replaced.external_attr = info.external_attr
+                    target.writestr(replaced, replacements[info.filename])
+                else:
+                    copy_member_raw(source, info, target)
+
+
+# 翻訳済みのプレゼンテーションを保存（partsは翻訳結果を書き戻したパーツ）
+# 入力を読み直せない場合などは、python-pptxでパッケージ全体を保存する
+def save_presentation(prs, input_file, output, parts):
+    if PACKAGE_WRITER == "partial" and (isinstance(input_file, (str, os.PathLike)) or _is_seekable(input_file)):
+        position = output.tell() if hasattr(output, "tell") else None
+        try:
+            save_partial(input_file, output, parts)
+            return
+        except Exception as e:
+            logger.warning(f"変更したパーツだけの保存に失敗したため全体を保存します: {e}")
+            # 途中まで書き込んだ内容を破棄する
+            if position is not None:
+                output.seek(position)
+                output.truncate()
+    prs.save(output)
+
+
+def _is_seekable(stream):
+    try:
+        return stream.seekable()
+    except (AttributeError, ValueError):
+        return False
@@ -0,0 +1,551 @@
+import os
+import re
+import logging
+import threading
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+from lxml import etree
+from pptx.opc.constants import CONTENT_TYPE as CT, RELATIONSHIP_TYPE as RT
+from pptx.opc.package import XmlPart
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import qn
+from pptx.text.text import _Run
+from translators import translate_batch, supports_tag_handling, get_engine_name, count_requests, estimate_translation_seconds
+from revisions import get_revision_store, content_hash
+from text_filter import get_text_filter
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 翻訳の単位（"run": テキスト実行ごと、"paragraph": 段落ごとにまとめて翻訳し書式を戻す）
+TRANSLATION_MODE = os.environ.get("TRANSLATION_MODE", "run")
+
+# テキストの抽出方法（"xml": スライドXMLから直接抽出、"shapes": python-pptxの図形をたどる）
+TEXT_EXTRACTOR = os.environ.get("TEXT_EXTRACTOR", "xml")
+
+# スライドが使うレイアウトとマスターのテキスト（フッター・プレースホルダーの入力例など）も翻訳するか（xml抽出のみ）
+TRANSLATE_MASTERS = os.environ.get("TRANSLATE_MASTERS", "1") == "1"
+
+RUN_TAG_PATTERN = re.compile(r"</?g\b[^>]*>")
+
+# スライドから参照されるパーツのうち、テキストを抽出する種類
+RELATED_PART_LOCATIONS = {
+    CT.DML_CHART: "chart",
+    CT.DML_DIAGRAM_DATA: "smartart",
+    CT.DML_DIAGRAM_DRAWING: "smartart",
+}
+
+
+# python-pptxがXMLとして読み込まないパーツ（SmartArtなど）のXMLツリー
+# 書き換えた後にsave()でパーツのバイト列に戻す
+class BlobXmlPart:
+    def __init__(self, part):
+        self.part = part
+        self.root = parse_xml(part.blob)
+
+    def save(self):
+        self.part.blob = etree.tostring(self.root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+
+# 翻訳対象のテキスト1件と、その書き戻し先（スライド内のrun）
+# partはBlobXmlPart上のrunの場合のみ指定する。package_partはrunを含むパッケージ内のパーツ
+class TextUnit:
+    def __init__(self, run, slide_index, location, part=None, package_part=None):
+        self.run = run
+        self.slide_index = slide_index
+        self.location = location  # "shape"・"table"・"notes"・"chart"・"smartart"など
+        self.part = part
+        self.package_part = package_part
+        self.text = run.text
+
+    # 重複排除と翻訳に使うキー（翻訳時と同じく前後の空白を除く）
+    @property
+    def key(self):
+        return self.text.strip()
+
+    # 書式タグを除いた翻訳対象のテキスト（文字数の集計用）
+    @property
+    def plain_text(self):
+        return self.key
+
+    # 翻訳結果を書き戻す
+    def apply(self, translated_text, font_name=None):
+        logger.debug(f"翻訳: '{self.text}' -> '{translated_text}'")
+        self.run.text = translated_text
+
+        # フォントを適用（選択されている場合）
+        if font_name and hasattr(self.run, "font") and self.run.font:
+            self.run.font.name = font_name
+
+    # テキストは元のまま残し、フォントだけを適用する（翻訳不要と判定したテキスト）
+    def keep(self, font_name=None):
+        if font_name and hasattr(self.run, "font") and self.run.font:
+            self.run.font.name = font_name
+
+    # 元のテキストに戻す（同じ抽出結果に別の言語の翻訳を適用する場合）
+    def restore(self):
+        self.run.text = self.text
+
+
+# 段落1つ分の翻訳対象（段落全体を1回で翻訳し、結果を元のrunに振り分ける）
+# markupがTrueの場合は各runを<g id="n">タグで囲んで送り、タグの位置でrunに戻す
+class ParagraphUnit:
+    def __init__(self, runs, slide_index, location, markup=False, part=None, package_part=None):
+        self.runs = runs
+        self.slide_index = slide_index
+        self.location = location
+        self.markup = markup
+        self.part = part
+        self.package_part = package_part
+        self.run_texts = [run.text for run in runs]
+        if markup:
+            self.text = "".join(f'<g id="{i}">{escape(run.text)}</g>' for i, run in enumerate(runs))
+        else:
+            self.text = "".join(run.text for run in runs)
+
+    @property
+    def key(self):
+        return self.text.strip()
+
+    @property
+    def plain_text(self):
+        return "".join(self.run_texts).strip()
+
+    # 翻訳結果を書き戻す
+    def apply(self, translated_text, font_name=None):
+        logger.debug(f"段落の翻訳: '{self.text}' -> '{translated_text}'")
+        segments = None
+        if self.markup:
+            segments = split_tagged_text(translated_text, len(self.runs))
+            if segments is None:
+                logger.warning(f"書式タグを解析できないため文字数の比率で振り分けます: {translated_text}")
+                translated_text = RUN_TAG_PATTERN.sub("", translated_text)
+        if segments is None:
+            segments = distribute_text(translated_text, [len(text) for text in self.run_texts])
+
+        for run, segment in zip(self.runs, segments):
+            run.text = segment
+
+            # フォントを適用（選択されている場合）
+            if font_name and segment and hasattr(run, "font") and run.font:
+                run.font.name = font_name
+
+    def keep(self, font_name=None):
+        for run, text in zip(self.runs, self.run_texts):
+            if font_name and text and hasattr(run, "font") and run.font:
+                run.font.name = font_name
+
+    def restore(self):
+        for run, text in zip(self.runs, self.run_texts):
+            run.text = text
+
+
+# <g id="n">タグつきの翻訳結果をrunごとのテキストに分割（解析できない場合はNone）
+def split_tagged_text(tagged_text, run_count):
+    try:
+        root = ElementTree.fromstring(f"<p>{tagged_text}</p>")
+    except ElementTree.ParseError:
+        return None
+
+    segments = [""] * run_count
+    # タグの外にあるテキストは直前のrunにつなげる（先頭の場合は最初のrun）
+    current = 0
+    segments[0] += root.text or ""
+    for element in root:
+        try:
+            current = int(element.get("id"))
+        except (TypeError, ValueError):
+            return None
+        if element.tag != "g" or not 0 <= current < run_count:
+            return None
+        segments[current] += "".join(element.itertext())
+        segments[current] += element.tail or ""
+    return segments
+
+
+# タグなしの翻訳結果を元のrunの文字数の比率で振り分ける（単語の途中では区切らない）
+def distribute_text(text, lengths):
+    total = sum(lengths)
+    if total == 0 or len(lengths) == 1:
+        return [text] + [""] * (len(lengths) - 1)
+
+    segments = []
+    start = 0
+    consumed = 0
+    for length in lengths[:-1]:
+        consumed += length
+        end = max(start, round(len(text) * consumed / total))
+        # 空白で区切られる言語の場合は最も近い空白の直後に区切り位置をずらす
+        before = text.rfind(" ", start, end)
+        after = text.find(" ", end)
+        candidates = [space + 1 for space in (before, after) if space != -1]
+        if candidates:
+            end = min(candidates, key=lambda position: abs(position - end))
+        segments.append(text[start:end])
+        start = end
+    segments.append(text[start:])
+    return segments
+
+
+# 段落ごとのrunのリストから翻訳対象を収集
+def _extract_paragraph_units(run_lists, slide_index, location, mode, part=None, package_part=None):
+    units = []
+    for runs in run_lists:
+        if mode == "paragraph":
+            if any(run.text and run.text.strip() for run in runs):
+                units.append(ParagraphUnit(runs, slide_index, location, markup=supports_tag_handling(),
+                                           part=part, package_part=package_part))
+            continue
+        for run in runs:
+            if run.text and run.text.strip():
+                units.append(TextUnit(run, slide_index, location, part=part, package_part=package_part))
+    return units
+
+
+# python-pptxの図形をたどって抽出（トップレベルのテキストフレームと表のみ）
+def extract_slide_units_shapes(slide, slide_index, mode):
+    units = []
+
+    # テキストフレームを持つすべての図形を処理
+    for shape in slide.shapes:
+        # テキストフレームがある場合
+        if shape.has_text_frame:
+            run_lists = [runs for paragraph in shape.text_frame.paragraphs for runs in split_run_lists(paragraph._p, paragraph)]
+            units.extend(_extract_paragraph_units(run_lists, slide_index, "shape", mode, package_part=slide.part))
+
+        # 表がある場合
+        if getattr(shape, "has_table", False):
+            try:
+                for row in shape.table.rows:
+                    for cell in row.cells:
+                        if cell.text_frame:
+                            run_lists = [runs for paragraph in cell.text_frame.paragraphs for runs in split_run_lists(paragraph._p, paragraph)]
+                            units.extend(_extract_paragraph_units(run_lists, slide_index, "table", mode, package_part=slide.part))
+            except Exception as table_e:
+                logger.error(f"表の処理中にエラーが発生しました: {table_e}")
+
+    return units
+
+
+# 段落（a:p）内のrun（a:r）を、改行（a:br）とフィールド（a:fld、スライド番号など）の位置で区切ったリスト
+# 段落単位の翻訳で区切りをまたぐと改行の位置が失われるため、区切りごとに別の翻訳対象にする
+def split_run_lists(p, parent=None):
+    runs = []
+    for child in p.iterchildren():
+        if child.tag == qn("a:r"):
+            runs.append(_Run(child, parent))
+        elif child.tag in (qn("a:br"), qn("a:fld")) and runs:
+            yield runs
+            runs = []
+    if runs:
+        yield runs
+
+
+# XMLツリー内のすべての段落（a:p）のrun（a:r）を1回の走査で収集（改行とフィールドの位置で区切る）
+# グループ図形・表・プレースホルダの中も含む（a:fldのスライド番号などは除く）
+def iter_xml_run_lists(root):
+    for p in root.iter(qn("a:p")):
+        yield from split_run_lists(p)
+
+
+# スライドと、そこから参照されるノート・グラフ・SmartArt・レイアウト・マスターのパーツ
+def _slide_text_parts(slide):
+    parts = [(slide.part, "slide")]
+    for rel in slide.part.rels.values():
+        if rel.is_external:
+            continue
+        part = rel.target_part
+        if rel.reltype == RT.NOTES_SLIDE:
+            parts.append((part, "notes"))
+        elif part.content_type in RELATED_PART_LOCATIONS:
+            parts.append((part, RELATED_PART_LOCATIONS[part.content_type]))
+    if TRANSLATE_MASTERS:
+        layout_part = slide.part.part_related_by(RT.SLIDE_LAYOUT)
+        parts.append((layout_part, "layout"))
+        parts.append((layout_part.part_related_by(RT.SLIDE_MASTER), "master"))
+    return parts
+
+
+# スライド関連のパーツのXMLから直接抽出（seen_partsで同じパーツの重複抽出を防ぐ）
+# レイアウトやマスターなど複数のスライドで共有するパーツは、最初に参照したスライドで1回だけ抽出する
+def extract_slide_units_xml(slide, slide_index, mode, seen_parts=None):
+    units = []
+    for part, location in _slide_text_parts(slide):
+        if seen_parts is not None:
+            if part.partname in seen_parts:
+                continue
+            seen_parts.add(part.partname)
+
+        if isinstance(part, XmlPart):
+            root, blob_part = part._element, None
+        else:
+            try:
+                blob_part = BlobXmlPart(part)
+            except Exception as e:
+                logger.error(f"パーツのXMLを読み込めませんでした: {part.partname}, {e}")
+                continue
+            root = blob_part.root
+        units.extend(_extract_paragraph_units(iter_xml_run_lists(root), slide_index, location, mode,
+                                              part=blob_part, package_part=part))
+    return units
+
+
+# 1. 抽出: スライド内の翻訳対象のテキストを位置情報つきで収集
+def extract_slide_units(slide, slide_index, mode=None, extractor=None, seen_parts=None):
+    mode = mode or TRANSLATION_MODE
+    extractor = extractor or TEXT_EXTRACTOR
+    if extractor == "shapes":
+        return extract_slide_units_shapes(slide, slide_index, mode)
+    return extract_slide_units_xml(slide, slide_index, mode, seen_parts)
+
+
+# スライド内の表の数
+def count_tables(slide):
+    return sum(1 for _ in slide.part._element.iter(qn("a:tbl")))
+
+
+# 翻訳せずにテキストの量と翻訳リクエスト数・所要時間の見積もりを集計（事前チェック用）
+# 翻訳メモリなどで再利用される分は考慮しないため、見積もりは上限の値になる（翻訳不要と判定されるテキストは除く）
+def analyze_units(units, source_lang=None, target_langs=None):
+    target_langs = target_langs or [None]
+    unique_units = {}
+    locations = {}
+    for unit in units:
+        unique_units.setdefault(unit.key, unit)
+        locations[unit.location] = locations.get(unit.location, 0) + 1
+
+    request_count = 0
+    estimated_chars = 0
+    units_skipped = 0
+    chars_skipped = 0
+    for target_lang in target_langs:
+        skipped = find_skipped_texts(unique_units, source_lang, target_lang)
+        pending = [key for key in unique_units if key not in skipped]
+        request_count += count_requests(pending)
+        estimated_chars += sum(len(unique_units[key].plain_text) for key in pending)
+        units_skipped += sum(1 for unit in units if unit.key in skipped)
+        chars_skipped += sum(len(unique_units[key].plain_text) for key in skipped)
+    return {
+        "text_units": len(units),
+        "unique_texts": len(unique_units),
+        "total_chars": sum(len(unit.plain_text) for unit in units),
+        "unique_chars": sum(len(unit.plain_text) for unit in unique_units.values()),
+        "locations": locations,
+        "languages": len(target_langs),
+        "engine": get_engine_name(),
+        "units_skipped": units_skipped,
+        "chars_skipped": chars_skipped,
+        "estimated_requests": request_count,
+        "estimated_chars": estimated_chars,
+        "estimated_seconds": round(estimate_translation_seconds(request_count), 1),
+    }
+
+
+# 翻訳APIに送らずにそのまま残すテキスト（{キー: 理由}、unique_unitsは{キー: 翻訳対象}）
+# 数値・URL・コード・翻訳しない用語・既に翻訳先の言語のテキストなど
+def find_skipped_texts(unique_units, source_lang, target_lang):
+    text_filter = get_text_filter()
+    if text_filter is None or not source_lang or not target_lang:
+        return {}
+    skipped = {}
+    for key, unit in unique_units.items():
+        reason = text_filter.classify(unit.plain_text, source_lang, target_lang)
+        if reason:
+            skipped[key] = reason
+    return skipped
+
+
+# 2. 翻訳: 重複を除いたテキストだけを翻訳し、{キー: 翻訳結果}を返す
+# progress_callbackには翻訳済みのテキスト数（重複を含む件数に換算）、error_callbackには翻訳に失敗したテキスト数、
+# skip_callbackには翻訳せずにそのまま残したテキスト数（重複を含む）と文字数（APIに送らずに済んだ文字数）を渡す
+def translate_unique_texts(units, source_lang, target_lang, progress_callback=None, error_callback=None, skip_callback=None,
+                           fallback_callback=None):
+    unique_units = {}
+    for unit in units:
+        unique_units.setdefault(unit.key, unit)
+    if not unique_units:
+        return {}
+
+    # 翻訳不要なテキストはAPIに送らず、結果にも含めない（apply_translationsで元のまま残す）
+    skipped = find_skipped_texts(unique_units, source_lang, target_lang)
+    translations = {}
+    if skipped:
+        units_skipped = sum(1 for unit in units if unit.key in skipped)
+        chars_skipped = sum(len(unique_units[key].plain_text) for key in skipped)
+        for reason in set(skipped.values()):
+            metrics.inc("translation_units_skipped_total", sum(1 for unit in units if skipped.get(unit.key) == reason), reason=reason)
+        metrics.inc("translation_chars_skipped_total", chars_skipped)
+        if skip_callback:
+            skip_callback(units_skipped, chars_skipped)
+    unique_texts = [key for key in unique_units if key not in skipped]
+    logger.info(
+        f"テキスト {len(units)}件のうち重複を除いた {len(unique_units)}件から、"
+        f"翻訳不要な {len(skipped)}件を除いた {len(unique_texts)}件を翻訳します"
+    )
+
+    def report_progress(done):
+        if progress_callback:
+            progress_callback(len(units) * (len(skipped) + done) // len(unique_units))
+
+    report_progress(0)
+    if not unique_texts:
+        return translations
+
+    # 書式タグつきの段落が含まれる場合はタグを保ったまま翻訳する
+    tag_handling = "xml" if any(getattr(unit, "markup", False) for unit in units) else None
+    translated_texts = translate_batch(
+        unique_texts, source_lang, target_lang,
+        progress_callback=report_progress, tag_handling=tag_handling, error_callback=error_callback,
+        fallback_callback=fallback_callback,
+    )
+    translations.update(zip(unique_texts, translated_texts))
+    return translations
+
+
+# スライドごとの内容のハッシュ（{スライド番号: ハッシュ}）
+def slide_content_hashes(units):
+    contents = {}
+    for unit in units:
+        contents.setdefault(unit.slide_index, []).append(f"{unit.location}\x1f{unit.key}")
+    return {slide_index: content_hash("\x1e".join(texts)) for slide_index, texts in contents.items()}
+
+
+# 2'. 差分翻訳: 同じプレゼンテーション（deck_key）の前回の翻訳結果を使い、変更・追加されたテキストだけを翻訳する
+# 翻訳結果（{キー: 翻訳結果}）と、再利用したスライド数・テキスト数を返す
+def translate_incremental(units, source_lang, target_lang, deck_key, progress_callback=None, error_callback=None, skip_callback=None,
+                          fallback_callback=None):
+    session = open_revision_session(deck_key, source_lang, target_lang)
+    if session is None:
+        return translate_unique_texts(units, source_lang, target_lang, progress_callback, error_callback, skip_callback,
+                                      fallback_callback), {}
+
+    translations, pending = session.reuse(units)
+    reused = len(units) - len(pending)
+    logger.info(
+        f"前回の翻訳結果を使用します: スライド {session.unchanged_slides}/{len(session.slide_hashes)}枚が変更なし、"
+        f"テキスト {reused}/{len(units)}件を再利用"
+    )
+
+    def report_progress(done):
+        if progress_callback:
+            progress_callback(reused + done)
+
+    report_progress(0)
+    # 予備の翻訳先で翻訳したテキストは保存せず、次回も翻訳する
+    fallback_keys = set()
+
+    def record_fallback(texts):
+        fallback_keys.update(texts)
+        if fallback_callback:
+            fallback_callback(texts)
+
+    translations.update(translate_unique_texts(pending, source_lang, target_lang, report_progress, error_callback, skip_callback,
+                                               record_fallback))
+    session.record(translations, exclude=fallback_keys)
+    session.save()
+    return translations, session.stats()
+
+
+# 差分翻訳の1回分（前回の翻訳結果の読み込みは最初に1回、保存は最後に1回だけ行う）
+# ストリーミング処理ではスライドのまとまりごとにreuseとrecordを呼ぶ（各スライドのテキストは同じまとまりに含める）
+class RevisionSession:
+    def __init__(self, store, deck_key, source_lang, target_lang):
+        self.store = store
+        self.deck_key = deck_key
+        self.source_lang = source_lang
+        self.target_lang = target_lang
+        self.engine = get_engine_name()
+        try:
+            self.previous_slides, self.previous_units = store.load(deck_key, self.engine, source_lang, target_lang)
+        except Exception as e:
+            logger.error(f"前回の翻訳結果を読み込めませんでした: {e}")
+            self.previous_slides, self.previous_units = set(), {}
+        self.slide_hashes = set()
+        self.units_to_save = {}
+        self.unchanged_slides = 0
+        self.units_reused = 0
+        self._lock = threading.Lock()
+
+    # 前回の翻訳結果を使えるテキストの翻訳結果（{キー: 翻訳結果}）と、翻訳が必要な対象のリストを返す
+    # 翻訳不要と判定したテキストは前回の翻訳結果を使わない（翻訳しない用語を追加した場合など）
+    def reuse(self, units):
+        unique_units = {}
+        for unit in units:
+            unique_units.setdefault(unit.key, unit)
+        skipped = find_skipped_texts(unique_units, self.source_lang, self.target_lang)
+        translations = {}
+        pending = []
+        for unit in units:
+            previous = None if unit.key in skipped else self.previous_units.get(content_hash(unit.key))
+            if previous is not None:
+                translations[unit.key] = previous
+            else:
+                pending.append(unit)
+        slide_hashes = slide_content_hashes(units).values()
+        with self._lock:
+            self.slide_hashes.update(slide_hashes)
+            self.unchanged_slides += sum(1 for slide_hash in slide_hashes if slide_hash in self.previous_slides)
+            self.units_reused += len(units) - len(pending)
+        metrics.inc("translation_units_reused_total", len(units) - len(pending))
+        return translations, pending
+
+    # 保存する翻訳結果を追加（翻訳に失敗したテキスト（元のテキストのまま）は保存せず、次回も翻訳する）
+    # excludeには保存しないテキスト（予備の翻訳先で翻訳したものなど）を指定する
+    def record(self, translations, exclude=()):
+        units_to_save = {
+            content_hash(key): translated for key, translated in translations.items()
+            if key not in exclude and (translated != key or content_hash(key) in self.previous_units)
+        }
+        with self._lock:
+            self.units_to_save.update(units_to_save)
+
+    def save(self):
+        try:
+            self.store.save(self.deck_key, self.engine, self.source_lang, self.target_lang,
+                            self.slide_hashes, self.units_to_save)
+        except Exception as e:
+            logger.error(f"翻訳結果を保存できませんでした: {e}")
+
+    def stats(self):
+        return {"slides_unchanged": self.unchanged_slides, "units_reused": self.units_reused}
+
+
+# 差分翻訳を始める（前回の翻訳結果の保存先が無効の場合はNone）
+def open_revision_session(deck_key, source_lang, target_lang):
+    store = get_revision_store()
+    if store is None:
+        return None
+    return RevisionSession(store, deck_key, source_lang, target_lang)
+
+
+# 3. 適用: 翻訳結果を各runに書き戻す
+def apply_translations(units, translations, font_name=None):
+    blob_parts = {}
+    for unit in units:
+        translated = translations.get(unit.key)
+        if translated is None:
+            # 翻訳結果がないテキスト（翻訳不要と判定したものなど）は元のまま残す
+            unit.keep(font_name)
+        else:
+            unit.apply(translated, font_name)
+        if unit.part is not None:
+            blob_parts[id(unit.part)] = unit.part
+
+    # XMLを直接書き換えたパーツをバイト列に戻す
+    for blob_part in blob_parts.values():
+        blob_part.save()
+
+
+# 翻訳結果を書き戻したパッケージ内のパーツ（保存時に置き換える対象）
+def modified_parts(units):
+    parts = {}
+    for unit in units:
+        if unit.package_part is not None:
+            parts[unit.package_part.partname] = unit.package_part
+    return list(parts.values())
+
+
+# 適用した翻訳結果を元のテキストに戻す（パーツのバイト列は次のapply_translationsで書き戻される）
+def restore_originals(units):
+    for unit in units:
+        unit.restore()
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 翻訳済みファイルのキャッシュの保存先（全ワーカーで共有、空文字を指定すると無効化）
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pptx_result_cache"))
+# キャッシュの合計サイズの上限（バイト、超えた分は最終利用日時の古い順に削除）
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# 最後に利用されてから保持する時間（秒）
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+# アップロードされたファイルの内容と翻訳オプションが同じ場合に、前回の翻訳済みファイルを返すキャッシュ
+# ファイルの最終更新日時を最終利用日時として使う
+class ResultCache:
+    def __init__(self, cache_dir, max_bytes=RESULT_CACHE_MAX_BYTES, ttl_seconds=RESULT_CACHE_TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # ファイルの内容と翻訳オプションからキーを作る（streamは読み込み後に先頭に戻す）
+    def make_key(self, stream, **options):
+        digest = hashlib.sha256()
+        stream.seek(0)
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        stream.seek(0)
+        digest.update(json.dumps(options, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    # キャッシュ済みのファイルのパスを取得（ない場合・期限切れの場合はNone）
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl_seconds:
+                os.unlink(path)
+                return None
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    # 翻訳済みファイル（パスまたはファイルオブジェクト）を登録し、上限を超えた分を削除
+    def put(self, key, source):
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if isinstance(source, (str, os.PathLike)):
+            shutil.copyfile(source, temp_path)
+        else:
+            source.seek(0)
+            with open(temp_path, "wb") as f:
+                shutil.copyfileobj(source, f)
+            source.seek(0)
+        os.replace(temp_path, path)
+        self.evict()
+
+    # 期限切れのファイルと、合計サイズの上限を超えた古いファイルを削除
+    def evict(self):
+        with self._lock:
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    stat = os.stat(path)
+                    if now - stat.st_mtime > self.ttl_seconds:
+                        os.unlink(path)
+                        continue
+                    # 書き込み中の一時ファイルは期限切れの場合のみ削除する
+                    if name.endswith(".tmp"):
+                        continue
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# 設定に従ってキャッシュを取得（無効または初期化失敗時はNone）
+def get_result_cache():
+    global _cache
+    if not RESULT_CACHE_DIR:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            try:
+                _cache = ResultCache(RESULT_CACHE_DIR)
+                logger.info(f"翻訳済みファイルのキャッシュを使用します: {RESULT_CACHE_DIR}")
+            except Exception as e:
+                logger.error(f"翻訳済みファイルのキャッシュの初期化に失敗しました: {e}")
+                return None
+        return _cache
@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from sqlite_store import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+# 前回の翻訳結果（スライドとテキストのハッシュ）の保存先（空文字を指定すると無効化）
+REVISION_STORE_PATH = os.environ.get(
+    "REVISION_STORE_PATH",
+    os.path.join(tempfile.gettempdir(), "pptx_revisions.sqlite3"),
+)
+# 保持するプレゼンテーション数（言語・翻訳エンジンごと、超えた分は更新日時の古い順に削除）
+REVISION_MAX_DECKS = int(os.environ.get("REVISION_MAX_DECKS", "5000"))
+
+
+# テキストの内容のハッシュ
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+# プレゼンテーションごとに、前回の翻訳時のスライドのハッシュとテキストごとの翻訳結果を保存する
+# 改訂版を翻訳する際は、ハッシュが一致するテキストに前回の翻訳結果を使う
+class RevisionStore(SqliteStore):
+    def __init__(self, path, max_decks=REVISION_MAX_DECKS):
+        super().__init__(path)
+        self.max_decks = max_decks
+        self._init_db()
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS revisions (
+                deck_key TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                slide_hashes TEXT NOT NULL,
+                units TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (deck_key, engine, source_lang, target_lang)
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_revisions_updated_at ON revisions (updated_at)")
+
+    # 前回の翻訳結果を取得（(スライドのハッシュの集合, {テキストのハッシュ: 翻訳結果})を返す）
+    def load(self, deck_key, engine, source_lang, target_lang):
+        row = self._connect().execute(
+            "SELECT slide_hashes, units FROM revisions "
+            "WHERE deck_key = ? AND engine = ? AND source_lang = ? AND target_lang = ?",
+            (deck_key, engine, source_lang, target_lang),
+        ).fetchone()
+        if row is None:
+            return set(), {}
+        return set(json.loads(row[0])), json.loads(row[1])
+
+    # 今回の翻訳結果で置き換える（削除されたテキストの翻訳結果は残さない）
+    def save(self, deck_key, engine, source_lang, target_lang, slide_hashes, units):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO revisions "
+                "(deck_key, engine, source_lang, target_lang, slide_hashes, units, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (deck_key, engine, source_lang, target_lang,
+                 json.dumps(sorted(slide_hashes)), json.dumps(units, ensure_ascii=False), time.time()),
+            )
+            self._evict_oldest(conn, "revisions", "updated_at", self.max_decks)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# 設定に従って保存先を取得（無効または初期化失敗時はNone）
+def get_revision_store():
+    global _store
+    if not REVISION_STORE_PATH:
+        return None
+    with _store_lock:
+        if _store is None:
+            try:
+                _store = RevisionStore(REVISION_STORE_PATH)
+                logger.info(f"前回の翻訳結果の保存先: {REVISION_STORE_PATH}")
+            except Exception as e:
+                logger.error(f"前回の翻訳結果の保存先の初期化に失敗しました: {e}")
+                return None
+        return _store
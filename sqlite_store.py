@@ -0,0 +1,44 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+# SQLiteを使った、複数のプロセスで共有する保存先の共通処理（翻訳メモリ・前回の翻訳結果）
+class SqliteStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    # スレッドごとに接続を持つ（gunicornの複数ワーカーからはWALモードで同時アクセス）
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # 書き込みのトランザクション（例外の場合はロールバック）
+    @contextmanager
+    def _transaction(self):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    # 行数が上限を超えた分を、order_columnの古い順に削除（削除した件数を返す）
+    def _evict_oldest(self, conn, table, order_column, max_rows):
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        if count <= max_rows:
+            return 0
+        conn.execute(
+            f"DELETE FROM {table} WHERE rowid IN "
+            f"(SELECT rowid FROM {table} ORDER BY {order_column} LIMIT ?)",
+            (count - max_rows,),
+        )
+        return count - max_rows
@@ -0,0 +1,350 @@
+import os
+import zipfile
+import threading
+import logging
+import posixpath
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from lxml import etree
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.oxml.ns import qn
+from package_writer import copy_member_raw
+from pipeline import (
+    RELATED_PART_LOCATIONS, TRANSLATE_MASTERS, BlobXmlPart, iter_xml_run_lists, _extract_paragraph_units,
+    analyze_units, translate_unique_texts, apply_translations, open_revision_session,
+)
+from translators import TRANSLATION_WORKERS
+from metrics import timed_phase
+
+logger = logging.getLogger(__name__)
+
+# スライドを1枚ずつ処理するストリーミング処理（"on"・"off"
+# "auto": STREAMING_MIN_SLIDES枚以上、または展開後の合計サイズがSTREAMING_MIN_BYTES以上の場合のみ）
+STREAMING_MODE = os.environ.get("STREAMING_MODE", "auto")
+STREAMING_MIN_SLIDES = int(os.environ.get("STREAMING_MIN_SLIDES", "200"))
+# 画像・動画が大きいファイルは、スライドが少なくても全体の読み込みでメモリを使うためストリーミング処理にする（0で無効）
+STREAMING_MIN_BYTES = int(os.environ.get("STREAMING_MIN_BYTES", str(200 * 1024 * 1024)))
+# 翻訳待ちのスライドとして同時に保持するXMLの合計サイズの上限（バイト、少なくとも1枚は保持する）
+STREAMING_BUFFER_BYTES = int(os.environ.get("STREAMING_BUFFER_BYTES", str(8 * 1024 * 1024)))
+# まとめて翻訳に送るテキスト数の目安（この数に達するまで後続のスライドのテキストをまとめる）
+STREAMING_BATCH_TEXTS = int(os.environ.get("STREAMING_BATCH_TEXTS", "200"))
+# スライドをまたいで翻訳結果を再利用するために保持する件数
+STREAMING_CACHE_ENTRIES = int(os.environ.get("STREAMING_CACHE_ENTRIES", "10000"))
+
+PACKAGE_RELS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+CONTENT_TYPES_NS = "{http://schemas.openxmlformats.org/package/2006/content-types}"
+OFFICE_DOCUMENT_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PRESENTATION_NS = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+
+
+# zipのメンバー1つ（BlobXmlPartでXMLとして読み書きする）
+class ZipMember:
+    def __init__(self, membername, blob):
+        self.membername = membername
+        self.partname = f"/{membername}"
+        self.blob = blob
+
+
+# python-pptxで全体を読み込まずに、パッケージの構成（コンテンツタイプとリレーションシップ）を調べる
+class PackageIndex:
+    def __init__(self, source):
+        self.source = source
+        self.names = set(source.namelist())
+        self._rels = {}
+        root = etree.fromstring(source.read("[Content_Types].xml"))
+        self.defaults = {
+            element.get("Extension").lower(): element.get("ContentType")
+            for element in root.iter(f"{CONTENT_TYPES_NS}Default")
+        }
+        self.overrides = {
+            element.get("PartName").lstrip("/"): element.get("ContentType")
+            for element in root.iter(f"{CONTENT_TYPES_NS}Override")
+        }
+
+    def content_type(self, membername):
+        if membername in self.overrides:
+            return self.overrides[membername]
+        return self.defaults.get(posixpath.splitext(membername)[1].lstrip(".").lower())
+
+    # パーツから参照される内部のパーツ（[(リレーションシップの種類, メンバー名, ID)]）
+    # レイアウトなど多くのスライドから参照されるパーツのために、読み込んだ結果を保持する
+    def rels(self, membername):
+        if membername not in self._rels:
+            self._rels[membername] = self._read_rels(membername)
+        return self._rels[membername]
+
+    def _read_rels(self, membername):
+        directory, filename = posixpath.split(membername)
+        rels_name = posixpath.join(directory, "_rels", f"{filename}.rels")
+        if rels_name not in self.names:
+            return []
+        rels = []
+        for rel in etree.fromstring(self.source.read(rels_name)).iter(f"{PACKAGE_RELS_NS}Relationship"):
+            if rel.get("TargetMode") == "External":
+                continue
+            target = rel.get("Target")
+            target = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join(directory, target))
+            rels.append((rel.get("Type"), target, rel.get("Id")))
+        return rels
+
+    # スライドのメンバー名（表示順）
+    def slide_membernames(self):
+        presentation = next(target for reltype, target, _ in self.rels("") if reltype == RT.OFFICE_DOCUMENT)
+        targets = {rel_id: target for reltype, target, rel_id in self.rels(presentation) if reltype == RT.SLIDE}
+        root = etree.fromstring(self.source.read(presentation))
+        return [
+            targets[element.get(f"{OFFICE_DOCUMENT_NS}id")]
+            for element in root.iter(f"{PRESENTATION_NS}sldId")
+            if element.get(f"{OFFICE_DOCUMENT_NS}id") in targets
+        ]
+
+    # スライドと、そこから参照されるノート・グラフ・SmartArt・レイアウト・マスターのメンバー名と位置
+    def slide_text_members(self, slide_membername):
+        members = [(slide_membername, "slide")]
+        layouts = []
+        for reltype, target, _ in self.rels(slide_membername):
+            if target not in self.names:
+                continue
+            if reltype == RT.NOTES_SLIDE:
+                members.append((target, "notes"))
+            elif reltype == RT.SLIDE_LAYOUT:
+                layouts.append(target)
+            elif self.content_type(target) in RELATED_PART_LOCATIONS:
+                members.append((target, RELATED_PART_LOCATIONS[self.content_type(target)]))
+        if TRANSLATE_MASTERS:
+            for layout in layouts:
+                members.append((layout, "layout"))
+                members.extend(
+                    (target, "master") for reltype, target, _ in self.rels(layout)
+                    if reltype == RT.SLIDE_MASTER and target in self.names
+                )
+        return members
+
+
+# ストリーミング処理を使うか（設定と入力のスライド数で判断）
+def should_stream(input_file):
+    if STREAMING_MODE == "off":
+        return False
+    if not isinstance(input_file, (str, os.PathLike)) and not hasattr(input_file, "seek"):
+        return False
+    if STREAMING_MODE == "on":
+        return True
+    try:
+        with zipfile.ZipFile(input_file) as source:
+            slide_count = len(PackageIndex(source).slide_membernames())
+            total_size = sum(info.file_size for info in source.infolist())
+    except Exception:
+        return False
+    finally:
+        if hasattr(input_file, "seek"):
+            input_file.seek(0)
+    return slide_count >= STREAMING_MIN_SLIDES or (STREAMING_MIN_BYTES > 0 and total_size >= STREAMING_MIN_BYTES)
+
+
+# python-pptxで全体を読み込まずに、テキストの量と翻訳の見積もりを集計（analyze_pptxと同じ結果）
+# 画像・動画などテキストを含まないメンバーは読み込まない
+def analyze_streaming(input_file, source_lang=None, target_langs=None, translation_mode=None):
+    if hasattr(input_file, "seek"):
+        input_file.seek(0)
+    units = []
+    tables = 0
+    with zipfile.ZipFile(input_file) as source:
+        index = PackageIndex(source)
+        slides = index.slide_membernames()
+        seen = set()
+        for slide_index, slide in enumerate(slides):
+            for membername, location in index.slide_text_members(slide):
+                if membername in seen:
+                    continue
+                seen.add(membername)
+                try:
+                    blob_part = BlobXmlPart(ZipMember(membername, source.read(membername)))
+                except Exception as e:
+                    logger.error(f"パーツのXMLを読み込めませんでした: {membername}, {e}")
+                    continue
+                if location == "slide":
+                    tables += sum(1 for _ in blob_part.root.iter(qn("a:tbl")))
+                units.extend(_extract_paragraph_units(iter_xml_run_lists(blob_part.root), slide_index, location,
+                                                      translation_mode, part=blob_part))
+
+    analysis = analyze_units(units, source_lang, target_langs)
+    analysis["slides"] = len(slides)
+    analysis["tables"] = tables
+    return analysis
+
+
+# 読み込み中のスライド1枚分（翻訳対象と書き戻し先のメンバー）
+class _PendingSlide:
+    def __init__(self, index, members, units, size):
+        self.index = index
+        self.members = members  # [(ZipMember, BlobXmlPart)]
+        self.units = units
+        self.size = size
+        self.future = None
+
+
+# スライドを1枚ずつ「読み込み・抽出・翻訳・書き戻し・解放」する（メモリ使用量はスライド数によらない）
+# 連続するスライドのテキストをSTREAMING_BATCH_TEXTS件ずつまとめて翻訳し、次のまとまりの翻訳と前のスライドの書き込みを並行して行う
+# 翻訳待ちのスライドはSTREAMING_BUFFER_BYTESまで先読みする
+# report_progressにはtranslate_pptxと同じ進捗の項目をキーワード引数で渡す
+# deck_keyを指定した場合は前回の翻訳結果を使い、変更されたテキストだけを翻訳する（前回の結果は最初に1回だけ読み込む）
+def translate_streaming(input_file, output, source_lang, target_lang, font_name=None, translation_mode=None, report_progress=None,
+                        deck_key=None):
+    report_progress = report_progress or (lambda **fields: None)
+    translated_cache = OrderedDict()
+    revision = open_revision_session(deck_key, source_lang, target_lang) if deck_key else None
+    counts = {"runs_failed": 0, "runs_fallback": 0, "units_skipped": 0, "chars_skipped": 0}
+    counts_lock = threading.Lock()
+
+    def report_failed(count):
+        with counts_lock:
+            counts["runs_failed"] += count
+            report_progress(runs_failed=counts["runs_failed"])
+
+    def report_fallback(count):
+        with counts_lock:
+            counts["runs_fallback"] += count
+            report_progress(runs_fallback=counts["runs_fallback"])
+
+    def report_skipped(units_skipped, chars_skipped):
+        with counts_lock:
+            counts["units_skipped"] += units_skipped
+            counts["chars_skipped"] += chars_skipped
+            report_progress(units_skipped=counts["units_skipped"], chars_skipped=counts["chars_skipped"])
+
+    # 前回の翻訳結果と、同じプレゼンテーション内で翻訳済みのテキストは再利用し、残りだけを翻訳する
+    def translate_units(units):
+        translations = {}
+        if revision is not None:
+            translations, units = revision.reuse(units)
+            report_progress(**revision.stats())
+        pending = []
+        for unit in units:
+            translated = translated_cache.get(unit.key)
+            if translated is not None:
+                translations[unit.key] = translated
+            else:
+                pending.append(unit)
+        # 予備の翻訳先で翻訳したテキストは前回の翻訳結果として保存しない
+        fallback_keys = set()
+
+        def record_fallback(texts):
+            fallback_keys.update(texts)
+            report_fallback(len(texts))
+
+        translations.update(translate_unique_texts(pending, source_lang, target_lang,
+                                                   error_callback=report_failed, skip_callback=report_skipped,
+                                                   fallback_callback=record_fallback))
+        if revision is not None:
+            revision.record(translations, exclude=fallback_keys)
+        return translations
+
+    if hasattr(input_file, "seek"):
+        input_file.seek(0)
+    with zipfile.ZipFile(input_file) as source, \
+            zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as target, \
+            ThreadPoolExecutor(max_workers=max(1, TRANSLATION_WORKERS), thread_name_prefix="stream") as executor:
+        index = PackageIndex(source)
+        slides = index.slide_membernames()
+        slide_members = [index.slide_text_members(slide) for slide in slides]
+        report_progress(stage="translate", slides_total=len(slides))
+
+        # テキストを含まないメンバー（画像・動画・レイアウトなど）は先に圧縮されたままコピーする
+        # （package_writer.copy_member_raw: 展開・再圧縮せずにローカルファイルヘッダーとデータをそのまま書き込む）
+        text_membernames = {membername for members in slide_members for membername, _ in members}
+        with timed_phase("save"):
+            for info in source.infolist():
+                if info.filename not in text_membernames:
+                    copy_member_raw(source, info, target)
+
+        written = set()
+        queue = deque()
+        batch = []
+        batch_texts = 0
+        buffered = 0
+        runs_total = 0
+        runs_translated = 0
+
+        # まとめたスライドのテキストを翻訳に送る
+        def submit_batch():
+            nonlocal batch_texts
+            future = executor.submit(translate_units, [unit for slide in batch for unit in slide.units])
+            for slide in batch:
+                slide.future = future
+            batch.clear()
+            batch_texts = 0
+
+        # 最も古いスライドの翻訳結果を書き戻して保存し、メモリから解放する
+        def write_oldest():
+            nonlocal buffered, runs_translated
+            slide = queue.popleft()
+            with timed_phase("translate"):
+                translations = slide.future.result()
+            for unit in slide.units:
+                if unit.key not in translations:
+                    continue
+                translated_cache[unit.key] = translations[unit.key]
+                translated_cache.move_to_end(unit.key)
+            while len(translated_cache) > STREAMING_CACHE_ENTRIES:
+                translated_cache.popitem(last=False)
+
+            with timed_phase("apply"):
+                apply_translations(slide.units, translations, font_name)
+            with timed_phase("save"):
+                for member, blob_part in slide.members:
+                    if blob_part is not None:
+                        target.writestr(member.membername, member.blob)
+                    else:
+                        copy_member_raw(source, source.getinfo(member.membername), target)
+            buffered -= slide.size
+            runs_translated += len(slide.units)
+            report_progress(slides_done=slide.index + 1, runs_translated=runs_translated)
+
+        for slide_index, members in enumerate(slide_members):
+            logger.info(f"スライド {slide_index+1} を処理中...")
+            with timed_phase("extract"):
+                loaded = []
+                units = []
+                size = 0
+                for membername, location in members:
+                    if membername in written:
+                        continue
+                    written.add(membername)
+                    member = ZipMember(membername, source.read(membername))
+                    size += len(member.blob)
+                    try:
+                        blob_part = BlobXmlPart(member)
+                    except Exception as e:
+                        logger.error(f"パーツのXMLを読み込めませんでした: {membername}, {e}")
+                        loaded.append((member, None))
+                        continue
+                    part_units = _extract_paragraph_units(iter_xml_run_lists(blob_part.root), slide_index, location,
+                                                          translation_mode, part=blob_part)
+                    # テキストがないパーツは書き換えずにコピーする
+                    loaded.append((member, blob_part if part_units else None))
+                    units.extend(part_units)
+                    if not part_units:
+                        member.blob = None
+
+            slide = _PendingSlide(slide_index, loaded, units, size)
+            queue.append(slide)
+            batch.append(slide)
+            buffered += size
+            batch_texts += len(units)
+            runs_total += len(units)
+            report_progress(runs_total=runs_total)
+            if batch_texts >= STREAMING_BATCH_TEXTS or buffered > STREAMING_BUFFER_BYTES:
+                submit_batch()
+
+            # 翻訳が済んだスライドを順に書き込み、先読みの上限を超えた場合は翻訳を待つ
+            while queue and queue[0].future is not None and (
+                    queue[0].future.done() or (buffered > STREAMING_BUFFER_BYTES and len(queue) > 1)):
+                write_oldest()
+
+        if batch:
+            submit_batch()
+        while queue:
+            write_oldest()
+    if revision is not None:
+        revision.save()
+    return output
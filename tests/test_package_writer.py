@@ -0,0 +1,106 @@
+import io
+import struct
+import zipfile
+
+from package_writer import copy_member_raw
+
+
+# シークできない出力（データ記述子つきのメンバーを作るため）
+class _UnseekableWriter(io.RawIOBase):
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def _build_source(members, force_zip64=False, unseekable=False):
+    output = _UnseekableWriter() if unseekable else io.BytesIO()
+    with zipfile.ZipFile(output, "w") as source:
+        for name, data, compress_type in members:
+            info = zipfile.ZipInfo(name, date_time=(2024, 1, 2, 3, 4, 6))
+            info.compress_type = compress_type
+            with source.open(info, "w", force_zip64=force_zip64) as f:
+                f.write(data)
+    return io.BytesIO(output.buffer.getvalue() if unseekable else output.getvalue())
+
+
+MEMBERS = [
+    ("ppt/media/image1.png", bytes(range(256)) * 400, zipfile.ZIP_STORED),
+    ("ppt/media/video1.mp4", b"\x00\x01movie" * 5000, zipfile.ZIP_DEFLATED),
+    ("ppt/slides/slide1.xml", "<p:sld>スライド</p:sld>".encode("utf-8"), zipfile.ZIP_DEFLATED),
+]
+
+
+def _copy_all(source_file):
+    output = io.BytesIO()
+    with zipfile.ZipFile(source_file) as source, zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            copy_member_raw(source, info, target)
+    output.seek(0)
+    return output
+
+
+def _assert_same_members(source_file, output):
+    with zipfile.ZipFile(source_file) as source, zipfile.ZipFile(output) as target:
+        assert target.testzip() is None
+        assert target.namelist() == source.namelist()
+        for info in source.infolist():
+            copied = target.getinfo(info.filename)
+            assert copied.CRC == info.CRC
+            assert copied.compress_type == info.compress_type
+            assert copied.compress_size == info.compress_size
+            assert copied.flag_bits & 0x08 == 0
+            assert target.read(info.filename) == source.read(info.filename)
+
+
+def test_copy_member_raw_keeps_bytes_and_crc():
+    source_file = _build_source(MEMBERS)
+    _assert_same_members(source_file, _copy_all(source_file))
+
+
+def test_copy_member_raw_drops_data_descriptor():
+    source_file = _build_source(MEMBERS, unseekable=True)
+    with zipfile.ZipFile(source_file) as source:
+        assert all(info.flag_bits & 0x08 for info in source.infolist())
+    _assert_same_members(source_file, _copy_all(source_file))
+
+
+def test_copy_member_raw_rewrites_zip64_extra():
+    source_file = _build_source(MEMBERS, force_zip64=True)
+    # ローカルファイルヘッダーにだけZIP64の拡張フィールドがある
+    with zipfile.ZipFile(source_file) as source:
+        for info in source.infolist():
+            source.fp.seek(info.header_offset)
+            assert struct.unpack("<H", source.fp.read(30)[28:30])[0] > 0
+    output = _copy_all(source_file)
+    _assert_same_members(source_file, output)
+    with zipfile.ZipFile(output) as target:
+        for info in target.infolist():
+            target.fp.seek(info.header_offset)
+            assert struct.unpack("<H", target.fp.read(30)[28:30])[0] == 0
+
+
+def test_copy_member_raw_mixed_with_writestr():
+    source_file = _build_source(MEMBERS)
+    output = io.BytesIO()
+    replaced = "<p:sld>Slide</p:sld>".encode("utf-8")
+    with zipfile.ZipFile(source_file) as source, zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            if info.filename == "ppt/slides/slide1.xml":
+                target.writestr(info.filename, replaced)
+            else:
+                copy_member_raw(source, info, target)
+        target.writestr("ppt/slides/slide2.xml", replaced)
+    output.seek(0)
+
+    with zipfile.ZipFile(source_file) as source, zipfile.ZipFile(output) as target:
+        assert target.testzip() is None
+        assert target.read("ppt/slides/slide1.xml") == replaced
+        assert target.read("ppt/slides/slide2.xml") == replaced
+        for name, data, _ in MEMBERS[:2]:
+            assert target.read(name) == data
+            assert target.getinfo(name).CRC == source.getinfo(name).CRC
@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# 翻訳APIに送らずにそのまま残すテキストの判定に使う規則（カンマ区切り、空文字で無効化）
+# "no_letters": 文字を含まない（数値・日付・割合・記号など）、"url": URL・メールアドレス、"code": コードの識別子や関数呼び出し
+# "glossary": 翻訳しない用語だけでできている、"script": 翻訳元の言語の文字を含まない・既に翻訳先の言語の文字だけでできている
+TEXT_FILTER_RULES = os.environ.get("TEXT_FILTER_RULES", "no_letters,url,code,glossary,script")
+# 翻訳しない用語（製品名など）。カンマ区切りで指定するか、1行に1つ書いたファイルのパスを指定する
+DO_NOT_TRANSLATE_TERMS = os.environ.get("DO_NOT_TRANSLATE_TERMS", "")
+DO_NOT_TRANSLATE_PATH = os.environ.get("DO_NOT_TRANSLATE_PATH", "")
+
+URL_PATTERN = re.compile(r"(?:https?://|ftp://|www\.)\S+|[\w.+-]+@[\w-]+(?:\.[\w-]+)+", re.IGNORECASE)
+# コードの断片: `...`で囲まれたもの、または空白を含まない次のもの
+# 引数のない関数呼び出し、a.b(x)・a::b・a->b・snake_caseなどコード特有の記号を含む識別子
+# 「Revenue(USD)」「Sales(2024)」のような表の見出しは対象外
+IDENTIFIER = r"[A-Za-z_$][\w$]*"
+CODE_PATTERN = re.compile(
+    rf"`[^`]+`"
+    rf"|{IDENTIFIER}(?:(?:\.|::|->){IDENTIFIER})*\(\);?"
+    rf"|{IDENTIFIER}(?:(?:\.|::|->){IDENTIFIER})+\((?:{IDENTIFIER}(?:,{IDENTIFIER})*)?\);?"
+    rf"|[\w$]*_[\w$]*\((?:{IDENTIFIER}(?:,{IDENTIFIER})*)?\);?"
+    rf"|{IDENTIFIER}_[\w$]*"
+    rf"|{IDENTIFIER}(?:(?:::|->){IDENTIFIER})+",
+    re.ASCII,  # 「KPI_売上目標」のような日本語を含む識別子はコードとみなさない
+)
+LATIN_PATTERN = re.compile(r"[A-Za-z\u00c0-\u024f]")
+# 言語ごとの文字（ラテン文字以外の言語のみ）
+SCRIPT_PATTERNS = {
+    "ja": re.compile(r"[\u3040-\u30ff\u31f0-\u31ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f]"),
+    "zh": re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]"),
+    "ko": re.compile(r"[\u1100-\u11ff\u3130-\u318f\uac00-\ud7af]"),
+}
+
+
+# 複数の用語をテキストを1回走査するだけで探す（Aho-Corasick法）
+class KeywordAutomaton:
+    def __init__(self, keywords):
+        self.transitions = [{}]
+        self.failure = [0]
+        self.lengths = [0]  # そのノードで終わる最も長い用語の長さ
+        for keyword in keywords:
+            keyword = normalize_text(keyword)
+            if keyword:
+                self._add(keyword)
+        self._build()
+
+    def _add(self, keyword):
+        node = 0
+        for ch in keyword:
+            next_node = self.transitions[node].get(ch)
+            if next_node is None:
+                next_node = len(self.transitions)
+                self.transitions.append({})
+                self.failure.append(0)
+                self.lengths.append(0)
+                self.transitions[node][ch] = next_node
+            node = next_node
+        self.lengths[node] = max(self.lengths[node], len(keyword))
+
+    # 失敗時の遷移先を幅優先で求める
+    def _build(self):
+        queue = deque(self.transitions[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, next_node in self.transitions[node].items():
+                fallback = self.failure[node]
+                while fallback and ch not in self.transitions[fallback]:
+                    fallback = self.failure[fallback]
+                self.failure[next_node] = self.transitions[fallback].get(ch, 0)
+                self.lengths[next_node] = max(self.lengths[next_node], self.lengths[self.failure[next_node]])
+                queue.append(next_node)
+
+    # 用語が見つかった範囲（[(開始位置, 終了位置)]、同じ位置で終わるものは最も長い用語のみ）
+    def find(self, text):
+        matches = []
+        node = 0
+        for end, ch in enumerate(text, 1):
+            while node and ch not in self.transitions[node]:
+                node = self.failure[node]
+            node = self.transitions[node].get(ch, 0)
+            if self.lengths[node]:
+                matches.append((end - self.lengths[node], end))
+        return matches
+
+    # 用語以外の部分に文字（数字・記号・空白以外）が残らないか
+    def covers(self, text):
+        covered = [False] * len(text)
+        for start, end in self.find(text):
+            covered[start:end] = [True] * (end - start)
+        return any(covered) and all(covered[i] or not ch.isalpha() for i, ch in enumerate(text))
+
+
+# 全角・半角や大文字・小文字の違いをそろえる
+def normalize_text(text):
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def _base_lang(lang):
+    return (lang or "").lower().split("-")[0]
+
+
+# 翻訳APIに送らずにそのまま残すテキストを判定する
+class TextFilter:
+    def __init__(self, rules, glossary_terms=()):
+        self.rules = set(rules)
+        self.glossary = KeywordAutomaton(glossary_terms) if glossary_terms else None
+        # 判定結果が変わる設定（規則と翻訳しない用語）のハッシュ（翻訳済みファイルのキャッシュのキーに使う）
+        settings = json.dumps([sorted(self.rules), sorted(glossary_terms)], ensure_ascii=False)
+        self.fingerprint = hashlib.sha256(settings.encode("utf-8")).hexdigest()[:32]
+
+    # 翻訳しない理由（翻訳する場合はNone）
+    def classify(self, text, source_lang, target_lang):
+        text = text.strip()
+        if not text:
+            return None
+        if "no_letters" in self.rules and not any(ch.isalpha() for ch in text):
+            return "no_letters"
+        tokens = text.split()
+        if "url" in self.rules and all(URL_PATTERN.fullmatch(token) or not any(ch.isalpha() for ch in token) for token in tokens):
+            return "url"
+        source_script = SCRIPT_PATTERNS.get(_base_lang(source_lang))
+        # 翻訳元の言語の文字を含むもの（`...`で囲まれたものも含む）はコードとみなさない
+        if (
+            "code" in self.rules
+            and (len(tokens) == 1 or text.startswith("`"))
+            and CODE_PATTERN.fullmatch(text)
+            and not (source_script is not None and source_script.search(text))
+        ):
+            return "code"
+        if "glossary" in self.rules and self.glossary is not None and self.glossary.covers(normalize_text(text)):
+            return "glossary"
+        if "script" in self.rules:
+            target_script = SCRIPT_PATTERNS.get(_base_lang(target_lang))
+            # 例: 日本語→英語で、日本語の文字を含まないテキスト
+            if source_script is not None and not source_script.search(text):
+                return "script"
+            # 例: 英語→日本語で、既に日本語の文字だけでできているテキスト
+            if source_script is None and target_script is not None and target_script.search(text) and not LATIN_PATTERN.search(text):
+                return "script"
+        return None
+
+
+# 翻訳しない用語を設定から読み込む
+def load_glossary_terms():
+    terms = [term.strip() for term in DO_NOT_TRANSLATE_TERMS.split(",")]
+    if DO_NOT_TRANSLATE_PATH:
+        with open(DO_NOT_TRANSLATE_PATH, encoding="utf-8") as f:
+            terms.extend(line.strip() for line in f)
+    return [term for term in dict.fromkeys(terms) if term and not term.startswith("#")]
+
+
+_text_filter = None
+_text_filter_lock = threading.Lock()
+
+
+# 判定の設定のハッシュ（無効の場合は空文字）
+def get_text_filter_fingerprint():
+    text_filter = get_text_filter()
+    return text_filter.fingerprint if text_filter is not None else ""
+
+
+# 設定に従ってフィルターを取得（無効または初期化失敗時はNone）
+def get_text_filter():
+    global _text_filter
+    rules = [rule.strip() for rule in TEXT_FILTER_RULES.split(",") if rule.strip()]
+    if not rules:
+        return None
+    with _text_filter_lock:
+        if _text_filter is None:
+            try:
+                terms = load_glossary_terms()
+                _text_filter = TextFilter(rules, terms)
+                logger.info(f"翻訳不要なテキストの判定を使用します: {', '.join(rules)}（翻訳しない用語 {len(terms)}件）")
+            except Exception as e:
+                logger.error(f"翻訳不要なテキストの判定の初期化に失敗しました: {e}")
+                return None
+        return _text_filter
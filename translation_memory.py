@@ -0,0 +1,134 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+import unicodedata
+from sqlite_store import SqliteStore
+
+logger = logging.getLogger(__name__)
+
+# 翻訳メモリの保存先（空文字を指定すると無効化）
+TRANSLATION_MEMORY_PATH = os.environ.get(
+    "TRANSLATION_MEMORY_PATH",
+    os.path.join(tempfile.gettempdir(), "pptx_translation_memory.sqlite3"),
+)
+# 保持する最大件数（超えた分は最終利用日時の古い順に削除）
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.environ.get("TRANSLATION_MEMORY_MAX_ENTRIES", "100000"))
+
+
+# 翻訳メモリのキーに使うテキストの正規化（Unicode正規化と空白の統一）
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFC", str(text)).split())
+
+
+# SQLiteを使ったプロセス間で共有できる翻訳メモリ
+class TranslationMemory(SqliteStore):
+    def __init__(self, path, max_entries=TRANSLATION_MEMORY_MAX_ENTRIES):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self._init_db()
+
+    def _init_db(self):
+        conn = self._connect()
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS translations (
+                engine TEXT NOT NULL,
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                source_text TEXT NOT NULL,
+                translated_text TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (engine, source_lang, target_lang, source_text)
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations (last_used)")
+        conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _add_stats(self, conn, **values):
+        conn.executemany(
+            "INSERT INTO stats (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            [(name, value) for name, value in values.items() if value],
+        )
+
+    # 登録済みの翻訳をまとめて取得（{正規化テキスト: 翻訳結果}を返す）
+    def get_many(self, engine, source_lang, target_lang, texts):
+        keys = list(dict.fromkeys(normalize_text(text) for text in texts))
+        if not keys:
+            return {}
+
+        conn = self._connect()
+        found = {}
+        # SQLiteのプレースホルダ数の上限に収まるよう分割して検索
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = conn.execute(
+                f"SELECT source_text, translated_text FROM translations "
+                f"WHERE engine = ? AND source_lang = ? AND target_lang = ? AND source_text IN ({placeholders})",
+                [engine, source_lang, target_lang] + part,
+            ).fetchall()
+            found.update(rows)
+
+        hits = [key for key in keys if key in found]
+        with self._transaction() as conn:
+            now = time.time()
+            conn.executemany(
+                "UPDATE translations SET last_used = ? "
+                "WHERE engine = ? AND source_lang = ? AND target_lang = ? AND source_text = ?",
+                [(now, engine, source_lang, target_lang, key) for key in hits],
+            )
+            self._add_stats(
+                conn,
+                hits=len(hits),
+                misses=len(keys) - len(hits),
+                saved_chars=sum(len(key) for key in hits),
+            )
+        return found
+
+    # 翻訳結果をまとめて登録し、上限を超えた古い翻訳を削除
+    def put_many(self, engine, source_lang, target_lang, pairs):
+        rows = [
+            (engine, source_lang, target_lang, normalize_text(text), str(translated), time.time())
+            for text, translated in pairs
+        ]
+        if not rows:
+            return
+
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO translations "
+                "(engine, source_lang, target_lang, source_text, translated_text, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._add_stats(conn, evictions=self._evict_oldest(conn, "translations", "last_used", self.max_entries))
+
+    # 全ワーカー共通のヒット数・ミス数などを取得
+    def stats(self):
+        conn = self._connect()
+        stats = {"hits": 0, "misses": 0, "saved_chars": 0, "evictions": 0}
+        stats.update(conn.execute("SELECT name, value FROM stats").fetchall())
+        stats["entries"] = conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        return stats
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+# 設定に従って翻訳メモリを取得（無効または初期化失敗時はNone）
+def get_translation_memory():
+    global _memory
+    if not TRANSLATION_MEMORY_PATH:
+        return None
+    with _memory_lock:
+        if _memory is None:
+            try:
+                _memory = TranslationMemory(TRANSLATION_MEMORY_PATH)
+                logger.info(f"翻訳メモリを使用します: {TRANSLATION_MEMORY_PATH}")
+            except Exception as e:
+                logger.error(f"翻訳メモリの初期化に失敗しました: {e}")
+                return None
+        return _memory
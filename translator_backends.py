@@ -0,0 +1,607 @@
+import os
+import re
+import time
+import logging
+import threading
+import multiprocessing
+from urllib.parse import quote_plus
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+from deep_translator import GoogleTranslator, DeeplTranslator
+from deep_translator.constants import BASE_URLS
+from deep_translator.exceptions import TooManyRequests, RequestError, TranslationNotFound
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 使用する翻訳バックエンド（"deepl"・"google"・"mock"、未指定の場合はDEEPL_API_KEYの有無で選択）
+TRANSLATION_BACKEND = os.environ.get("TRANSLATION_BACKEND", "")
+
+# DeepL APIキー（環境変数から取得する例）
+DEEPL_API_KEY = os.environ.get("DEEPL_API_KEY", "")
+# 接続先（負荷試験ではローカルの代替サーバーを指定できる）
+DEEPL_API_URL = os.environ.get("DEEPL_API_URL", BASE_URLS.get("DEEPL_FREE").format(version="v2") + "translate")
+GOOGLE_TRANSLATE_URL = os.environ.get("GOOGLE_TRANSLATE_URL", BASE_URLS.get("GOOGLE_TRANSLATE"))
+
+# HTTPリクエストのタイムアウト（秒）
+TRANSLATION_TIMEOUT = float(os.environ.get("TRANSLATION_TIMEOUT", "30"))
+# 1秒あたりのリクエスト数の上限とバースト数（DeepL/Googleのクォータ対策）
+TRANSLATION_RATE_LIMIT = float(os.environ.get("TRANSLATION_RATE_LIMIT", "5"))
+TRANSLATION_RATE_BURST = int(os.environ.get("TRANSLATION_RATE_BURST", "5"))
+# mockバックエンドの1リクエストあたりの待ち時間（秒）
+MOCK_TRANSLATOR_LATENCY = float(os.environ.get("MOCK_TRANSLATOR_LATENCY", "0"))
+
+# failoverバックエンドで使う翻訳先（優先順、カンマ区切り）
+TRANSLATION_PROVIDERS = os.environ.get("TRANSLATION_PROVIDERS", "deepl,google")
+# 連続してこの回数失敗した翻訳先は、CIRCUIT_RESET_SECONDS秒のあいだ使わない
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", "30"))
+# 応答がこの秒数を超えた場合は次の翻訳先にも同じリクエストを送り、先に返った結果を使う（0で無効）
+TRANSLATION_HEDGE_DELAY = float(os.environ.get("TRANSLATION_HEDGE_DELAY", "0"))
+# 翻訳先ごとの同時リクエスト数の上限と、同時数を減らす応答時間の目安（秒）
+ADAPTIVE_CONCURRENCY_MAX = int(os.environ.get("ADAPTIVE_CONCURRENCY_MAX", os.environ.get("TRANSLATION_WORKERS", "4")))
+TRANSLATION_LATENCY_TARGET = float(os.environ.get("TRANSLATION_LATENCY_TARGET", "5"))
+
+
+# トークンバケット方式のレート制限（プロセス内の全スレッドで共有）
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    # トークンを1つ取得できるまで待つ
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# 複数プロセスで共有するトークンバケット（バッチ処理のプロセスプールで使う）
+# 残りトークン数と更新時刻を共有メモリに置き、プロセス間のロックで更新する
+class SharedTokenBucket(TokenBucket):
+    def __init__(self, rate, burst, context=multiprocessing):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = context.RawValue("d", float(self.capacity))
+        self._updated = context.RawValue("d", time.monotonic())
+        self._lock = context.Lock()
+
+    @property
+    def tokens(self):
+        return self._tokens.value
+
+    @tokens.setter
+    def tokens(self, value):
+        self._tokens.value = value
+
+    @property
+    def updated(self):
+        return self._updated.value
+
+    @updated.setter
+    def updated(self, value):
+        self._updated.value = value
+
+
+rate_limiter = TokenBucket(TRANSLATION_RATE_LIMIT, TRANSLATION_RATE_BURST)
+
+
+# 使用するレート制限を差し替える（プロセスプールの各ワーカーで共有のバケットを使う場合など）
+def use_rate_limiter(limiter):
+    global rate_limiter
+    rate_limiter = limiter
+
+
+# (位置, テキスト)のリストをプロバイダの上限に収まるチャンクに分割
+# sizeには1テキストの大きさの数え方を指定する（既定は文字数）
+def split_into_chunks(items, max_items, max_chars, separator_len=0, size=len):
+    chunks = []
+    current = []
+    current_chars = 0
+    for item in items:
+        added = size(item[1]) + (separator_len if current else 0)
+        if current and (len(current) >= max_items or current_chars + added > max_chars):
+            chunks.append(current)
+            current = []
+            current_chars = 0
+            added = size(item[1])
+        current.append(item)
+        current_chars += added
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# フォーム形式で送信する1テキストのバイト数（"&text="の分を含む）
+def form_encoded_size(text):
+    return len(quote_plus(text)) + len("&text=")
+
+
+# URLのクエリに入れる1テキストのバイト数
+def url_encoded_size(text):
+    return len(quote_plus(text))
+
+
+SENTENCE_END_PATTERN = re.compile(r"(?<=[\n。．！？!?])|(?<=[.] )")
+RUN_TAG_END_PATTERN = re.compile(r"(?<=</g>)")
+
+
+# 本文の上限を超える長いテキストを、上限に収まる部分に分ける（[(部分, 末尾の空白)]）
+# 改行・文末で区切り、書式タグつきのテキストはタグの境目（</g>の後）でのみ区切る
+# 1文だけで上限を超える場合は文字数で区切る（タグつきの場合は区切らない）
+def split_long_text(text, max_bytes, tagged=False):
+    sentences = [s for s in (RUN_TAG_END_PATTERN if tagged else SENTENCE_END_PATTERN).split(text) if s]
+    pieces = []
+    current = ""
+    for sentence in sentences:
+        if current and form_encoded_size(current + sentence) > max_bytes:
+            pieces.append(current)
+            current = ""
+        current += sentence
+        while not tagged and form_encoded_size(current) > max_bytes:
+            end = len(current)
+            while end > 1 and form_encoded_size(current[:end]) > max_bytes:
+                end = max(1, end * 3 // 4)
+            pieces.append(current[:end])
+            current = current[end:]
+    if current:
+        pieces.append(current)
+    # 末尾の空白・改行は翻訳で失われることがあるため、分けて保持する
+    return [(piece.rstrip(), piece[len(piece.rstrip()):]) for piece in pieces]
+
+
+BACKENDS = {}
+
+
+# 翻訳バックエンドを名前で登録するデコレータ
+def register_backend(cls):
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+# 翻訳バックエンドの基底クラス
+# translate()は1件、translate_batch()はplan_chunks()で分割した1チャンクを1リクエストで翻訳する
+class TranslatorBackend:
+    name = None
+    supports_tag_handling = False
+    max_items = 50
+    max_chars = 5000
+
+    def translate(self, text, source_lang, target_lang):
+        raise NotImplementedError
+
+    def translate_batch(self, texts, source_lang, target_lang, tag_handling=None):
+        return [self.translate(text, source_lang, target_lang) for text in texts]
+
+    def plan_chunks(self, items):
+        return split_into_chunks(items, self.max_items, self.max_chars)
+
+
+# HTTPを使うバックエンドの共通処理（スレッドごとにkeep-aliveのセッションを持つ）
+class HttpTranslatorBackend(TranslatorBackend):
+    def __init__(self):
+        self._local = threading.local()
+
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._local.session = session
+        return session
+
+
+@register_backend
+class DeeplBackend(HttpTranslatorBackend):
+    name = "deepl"
+    supports_tag_handling = True
+    # DeepLのバッチ上限（1リクエストあたり最大50テキスト、本文128KiBまで）
+    # 本文の大きさはフォーム形式にエンコードした後のバイト数で数える（日本語は1文字あたり約9バイトになる）
+    max_items = 50
+    max_chars = 30000
+    max_request_bytes = 120 * 1024  # 言語コードなど他の項目の分の余裕を残す
+
+    def __init__(self, api_key=None, url=None):
+        super().__init__()
+        self.api_key = api_key or DEEPL_API_KEY
+        self.url = url or DEEPL_API_URL
+
+    # DeepLの言語コードに変換（deep_translatorの対応表を使う）
+    @lru_cache(maxsize=None)
+    def _language_codes(self, source_lang, target_lang):
+        translator = DeeplTranslator(api_key=self.api_key, source=source_lang, target=target_lang)
+        return translator.source, translator.target
+
+    def translate(self, text, source_lang, target_lang):
+        return self.translate_batch([text], source_lang, target_lang)[0]
+
+    def plan_chunks(self, items):
+        return split_into_chunks(items, self.max_items, self.max_request_bytes, size=form_encoded_size)
+
+    # tag_handlingに"xml"を指定するとタグを保ったまま翻訳される
+    def translate_batch(self, texts, source_lang, target_lang, tag_handling=None):
+        # 1テキストだけで本文の上限を超える場合（長いスピーカーノートなど）は区切りの位置で分けて翻訳し、つなげ直す
+        if len(texts) == 1 and form_encoded_size(texts[0]) > self.max_request_bytes:
+            pieces = split_long_text(texts[0], self.max_request_bytes, tagged=bool(tag_handling))
+            if len(pieces) > 1:
+                translated = [None] * len(pieces)
+                for chunk in self.plan_chunks([(i, text) for i, (text, _) in enumerate(pieces)]):
+                    results = self._request([text for _, text in chunk], source_lang, target_lang, tag_handling)
+                    for (i, _), result in zip(chunk, results):
+                        translated[i] = result
+                return ["".join(result + trailing for result, (_, trailing) in zip(translated, pieces))]
+        return self._request(texts, source_lang, target_lang, tag_handling)
+
+    def _request(self, texts, source_lang, target_lang, tag_handling):
+        source, target = self._language_codes(source_lang, target_lang)
+        data = {"source_lang": source, "target_lang": target, "text": texts}
+        if tag_handling:
+            data["tag_handling"] = tag_handling
+        rate_limiter.acquire()
+        response = self.session().post(
+            self.url,
+            headers={"Authorization": f"DeepL-Auth-Key {self.api_key}"},
+            data=data,
+            timeout=TRANSLATION_TIMEOUT,
+        )
+        response.raise_for_status()
+        translations = response.json().get("translations", [])
+        if len(translations) != len(texts):
+            raise ValueError(f"DeepLの翻訳結果の件数が一致しません: {len(translations)} != {len(texts)}")
+        return [t["text"] for t in translations]
+
+
+@register_backend
+class GoogleBackend(HttpTranslatorBackend):
+    name = "google"
+    # Googleは1リクエスト5000文字未満のため、改行で連結してまとめて送信する
+    # GETのURLで送るため、大きさはURLエンコードした後のバイト数で数える（日本語は1文字あたり9バイト、改行は"%0A"）
+    max_items = 100
+    max_chars = 4900
+    max_request_bytes = 4900  # 言語コードなど他のパラメータの分の余裕を残す
+    separator = "\n"
+
+    # Googleの言語コードに変換（deep_translatorの対応表を使う）
+    @lru_cache(maxsize=None)
+    def _language_codes(self, source_lang, target_lang):
+        translator = GoogleTranslator(source=source_lang, target=target_lang)
+        return translator.source, translator.target
+
+    # deep_translatorのGoogleTranslatorと同じページを、使い回すセッションで取得する
+    def translate(self, text, source_lang, target_lang):
+        source, target = self._language_codes(source_lang, target_lang)
+        rate_limiter.acquire()
+        response = self.session().get(
+            GOOGLE_TRANSLATE_URL,
+            params={"tl": target, "sl": source, "q": text},
+            timeout=TRANSLATION_TIMEOUT,
+        )
+        if response.status_code == 429:
+            raise TooManyRequests()
+        # 429以外の4xx（URLが長すぎるなど）は再試行しても同じ結果になるため、再試行しない例外にする
+        if 400 <= response.status_code < 500:
+            response.raise_for_status()
+        if not 200 <= response.status_code < 300:
+            raise RequestError()
+
+        soup = BeautifulSoup(response.text, "html.parser")
+        element = soup.find("div", {"class": "t0"}) or soup.find("div", {"class": "result-container"})
+        if not element:
+            raise TranslationNotFound(text)
+        return element.get_text(strip=True)
+
+    # 改行で連結して1リクエストで翻訳し、結果を分割して戻す
+    def translate_batch(self, texts, source_lang, target_lang, tag_handling=None):
+        if len(texts) == 1:
+            # 1テキストだけでURLの上限を超える場合は区切りの位置で分けて翻訳し、つなげ直す
+            if url_encoded_size(texts[0]) > self.max_request_bytes:
+                pieces = split_long_text(texts[0], self.max_request_bytes - len("&text="))
+                return ["".join(self.translate(text, source_lang, target_lang) + trailing for text, trailing in pieces)]
+            return [self.translate(texts[0], source_lang, target_lang)]
+
+        result = self.translate(self.separator.join(texts), source_lang, target_lang)
+        parts = str(result).split(self.separator) if result is not None else []
+        if len(parts) == len(texts):
+            return [part.strip() for part in parts]
+
+        # 行数が崩れた場合は1件ずつ翻訳する
+        logger.warning(f"バッチ翻訳の行数が一致しないため個別翻訳に切り替えます: {len(parts)} != {len(texts)}")
+        return [self.translate(text, source_lang, target_lang) for text in texts]
+
+    # 改行を含むテキストと、1テキストだけでURLの上限を超えるテキストは連結できないため単独で送る
+    def plan_chunks(self, items):
+        separator_len = url_encoded_size(self.separator)
+        joinable = []
+        singles = []
+        for item in items:
+            if self.separator in item[1] or url_encoded_size(item[1]) > self.max_request_bytes:
+                singles.append([item])
+            else:
+                joinable.append(item)
+        return split_into_chunks(joinable, self.max_items, self.max_request_bytes, separator_len, size=url_encoded_size) + singles
+
+
+# ネットワークを使わない代替のバックエンド（開発・負荷試験用）
+@register_backend
+class MockBackend(TranslatorBackend):
+    name = "mock"
+    supports_tag_handling = True
+    max_items = 100
+    max_chars = 5000
+
+    def __init__(self, latency=None):
+        self.latency = MOCK_TRANSLATOR_LATENCY if latency is None else latency
+
+    # 1回のリクエストを模擬（訳文の代わりに言語コードを付ける）
+    def request(self, texts, source_lang, target_lang):
+        if self.latency:
+            time.sleep(self.latency)
+        return [f"[{target_lang}] {text}" for text in texts]
+
+    def translate(self, text, source_lang, target_lang):
+        return self.request([text], source_lang, target_lang)[0]
+
+    def translate_batch(self, texts, source_lang, target_lang, tag_handling=None):
+        return self.request(texts, source_lang, target_lang)
+
+
+# 翻訳先が混雑しているときのエラーか（429・503・タイムアウト）
+def is_congestion_error(e):
+    if isinstance(e, (TooManyRequests, requests.Timeout)):
+        return True
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code in (429, 503)
+    return False
+
+
+# すべての翻訳先が使えない場合のエラー
+class ProvidersUnavailableError(Exception):
+    pass
+
+
+# 翻訳結果のリスト（どの翻訳先で翻訳したか。fallbackは最優先以外の翻訳先の結果の場合にTrue）
+# 予備の翻訳先の結果は翻訳メモリや前回の翻訳結果として保存しない（最優先の翻訳先が復旧した後に翻訳し直すため）
+class TranslatedTexts(list):
+    def __init__(self, texts, provider, fallback=False):
+        super().__init__(texts)
+        self.provider = provider
+        self.fallback = fallback
+
+
+# 失敗が続いた翻訳先への送信を一定時間止めるサーキットブレーカー
+# 止めている時間が過ぎた後は1件だけ試し、成功すれば再開する
+class CircuitBreaker:
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    # 送信してよいか
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    # 失敗を記録（送信を止めた場合はTrueを返す）
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._trial = False
+                return True
+            return False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if self._trial else "open"
+
+
+# 応答時間と429に応じて同時リクエスト数を調整する
+# （AIMD: 目安より速く成功すれば少しずつ増やし、混雑または目安より遅い場合は半分に減らす）
+class AdaptiveConcurrencyLimiter:
+    def __init__(self, maximum=ADAPTIVE_CONCURRENCY_MAX, minimum=1, latency_target=TRANSLATION_LATENCY_TARGET):
+        self.maximum = max(minimum, maximum)
+        self.minimum = minimum
+        self.latency_target = latency_target
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    # latencyは成功した場合の応答時間（失敗した場合はNone）
+    def release(self, latency=None, congested=False):
+        with self._condition:
+            self.in_flight -= 1
+            if congested or (latency is not None and latency > self.latency_target):
+                self.limit = max(self.minimum, self.limit / 2)
+            elif latency is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+# 複数の翻訳先を優先順に使うバックエンド
+# 失敗した場合は次の翻訳先に切り替え（failover）、遅い場合は次の翻訳先にも送る（hedging）
+@register_backend
+class FailoverBackend(TranslatorBackend):
+    name = "failover"
+
+    def __init__(self, providers=None, hedge_delay=None):
+        if providers is None:
+            names = [name.strip() for name in TRANSLATION_PROVIDERS.split(",") if name.strip()]
+            unknown = [name for name in names if name not in BACKENDS or name == self.name]
+            if unknown or not names:
+                raise ValueError(f"未対応の翻訳先です: {', '.join(unknown) or '(なし)'}")
+            providers = [BACKENDS[name]() for name in names]
+        self.providers = providers
+        self.breakers = {provider.name: CircuitBreaker() for provider in providers}
+        self.limiters = {provider.name: AdaptiveConcurrencyLimiter() for provider in providers}
+        self.hedge_delay = TRANSLATION_HEDGE_DELAY if hedge_delay is None else hedge_delay
+        self.executor = ThreadPoolExecutor(max_workers=ADAPTIVE_CONCURRENCY_MAX * len(providers), thread_name_prefix="hedge")
+
+        # チャンクの分割と書式タグの扱いは最優先の翻訳先に合わせる
+        primary = providers[0]
+        self.supports_tag_handling = primary.supports_tag_handling
+        self.max_items = primary.max_items
+        self.max_chars = primary.max_chars
+
+    def plan_chunks(self, items):
+        return self.providers[0].plan_chunks(items)
+
+    def translate(self, text, source_lang, target_lang):
+        return self.translate_batch([text], source_lang, target_lang)[0]
+
+    # 1つの翻訳先で翻訳（その翻訳先の上限に合わせて分割し直し、同時リクエスト数を調整する）
+    def _request(self, provider, texts, source_lang, target_lang, tag_handling):
+        breaker = self.breakers[provider.name]
+        limiter = self.limiters[provider.name]
+        results = [None] * len(texts)
+        try:
+            for chunk in provider.plan_chunks(list(enumerate(texts))):
+                limiter.acquire()
+                started = time.perf_counter()
+                try:
+                    translated = provider.translate_batch(
+                        [text for _, text in chunk], source_lang, target_lang, tag_handling=tag_handling,
+                    )
+                except Exception as e:
+                    limiter.release(congested=is_congestion_error(e))
+                    raise
+                limiter.release(latency=time.perf_counter() - started)
+                for (i, _), result in zip(chunk, translated):
+                    results[i] = result
+        except Exception as e:
+            if breaker.record_failure():
+                metrics.inc("translation_circuit_opened_total", provider=provider.name)
+                logger.warning(f"翻訳先 {provider.name} への送信を{breaker.reset_seconds:.0f}秒間停止します: {e}")
+            raise
+        breaker.record_success()
+        return TranslatedTexts(results, provider.name, fallback=provider is not self.providers[0])
+
+    # 送信を止めていない次の翻訳先
+    # 書式タグつきのテキストは、タグを扱えない翻訳先には送らない（タグが訳文に崩れて混ざるため）
+    def _next_provider(self, providers, tag_handling=None):
+        for provider in providers:
+            if tag_handling and not provider.supports_tag_handling:
+                continue
+            if self.breakers[provider.name].allow():
+                return provider
+        return None
+
+    def translate_batch(self, texts, source_lang, target_lang, tag_handling=None):
+        args = (texts, source_lang, target_lang, tag_handling)
+        remaining = iter(self.providers)
+        provider = self._next_provider(remaining, tag_handling)
+        error = None
+        while provider is not None:
+            try:
+                if self.hedge_delay <= 0:
+                    return self._request(provider, *args)
+                return self._hedged_request(provider, remaining, args)
+            except Exception as e:
+                error = e
+                logger.warning(f"翻訳先 {provider.name} で失敗しました: {e}")
+            provider = self._next_provider(remaining, tag_handling)
+            if provider is not None:
+                metrics.inc("translation_failovers_total", provider=provider.name)
+                logger.info(f"翻訳先を {provider.name} に切り替えます")
+        if error is not None:
+            raise error
+        if tag_handling:
+            raise ProvidersUnavailableError("書式タグを扱えるすべての翻訳先への送信を停止しています")
+        raise ProvidersUnavailableError("すべての翻訳先への送信を停止しています")
+
+    # 一定時間内に応答がない場合は次の翻訳先にも送り、先に成功した結果を使う
+    def _hedged_request(self, provider, remaining, args):
+        future = self.executor.submit(self._request, provider, *args)
+        try:
+            return future.result(timeout=self.hedge_delay)
+        except FutureTimeoutError:
+            pass
+
+        hedge = self._next_provider(remaining, args[3])
+        if hedge is None:
+            return future.result()
+        metrics.inc("translation_hedged_requests_total", provider=hedge.name)
+        logger.info(f"翻訳先 {provider.name} の応答が遅いため {hedge.name} にも送信します")
+        futures = [future, self.executor.submit(self._request, hedge, *args)]
+        error = None
+        for done in as_completed(futures):
+            try:
+                return done.result()
+            except Exception as e:
+                error = e
+        raise error
+
+    # 翻訳先ごとの状態（サーキットブレーカーと同時リクエスト数の上限）
+    def status(self):
+        return {
+            provider.name: {
+                "circuit": self.breakers[provider.name].state,
+                "concurrency_limit": int(self.limiters[provider.name].limit),
+                "in_flight": self.limiters[provider.name].in_flight,
+            }
+            for provider in self.providers
+        }
+
+
+_active_backend = None
+_active_backend_lock = threading.Lock()
+
+
+# 設定に従って翻訳バックエンドを取得（プロセス内で1つを使い回す）
+def get_backend():
+    global _active_backend
+    with _active_backend_lock:
+        if _active_backend is None:
+            name = TRANSLATION_BACKEND or ("deepl" if DEEPL_API_KEY else "google")
+            if name not in BACKENDS:
+                raise ValueError(f"未対応の翻訳バックエンドです: {name}（{', '.join(sorted(BACKENDS))}）")
+            _active_backend = BACKENDS[name]()
+            logger.info(f"翻訳バックエンド: {name}")
+        return _active_backend
+
+
+# 使用する翻訳バックエンドを差し替える（Noneを渡すと設定に従って選び直す）
+def use_backend(backend):
+    global _active_backend
+    with _active_backend_lock:
+        _active_backend = backend
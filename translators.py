@@ -0,0 +1,193 @@
+import os
+import time
+import random
+import logging
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from deep_translator.exceptions import TooManyRequests, RequestError
+from translation_memory import get_translation_memory, normalize_text
+from translator_backends import get_backend, TRANSLATION_RATE_LIMIT, TRANSLATION_RATE_BURST
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 並列に送信するリクエスト数（1の場合は逐次処理）
+TRANSLATION_WORKERS = int(os.environ.get("TRANSLATION_WORKERS", "4"))
+# 429/5xxの場合の再試行回数と初回の待ち時間（秒、指数的に増加）
+TRANSLATION_MAX_RETRIES = int(os.environ.get("TRANSLATION_MAX_RETRIES", "3"))
+TRANSLATION_RETRY_BASE_DELAY = float(os.environ.get("TRANSLATION_RETRY_BASE_DELAY", "1.0"))
+# 所要時間の見積もりに使う1リクエストあたりの時間（秒、実測値がある場合はその平均を使う）
+ESTIMATED_SECONDS_PER_REQUEST = float(os.environ.get("ESTIMATED_SECONDS_PER_REQUEST", "1.0"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# 翻訳リクエスト用のスレッドプールを取得（スレッドごとのセッションを使い回すため共有）
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TRANSLATION_WORKERS, thread_name_prefix="translate")
+        return _executor
+
+
+# 使用する翻訳エンジン名
+def get_engine_name():
+    return get_backend().name
+
+
+# 書式タグを保ったまま翻訳できるエンジンか（DeepLのtag_handlingなど）
+def supports_tag_handling():
+    return get_backend().supports_tag_handling
+
+
+# テキストのリストを翻訳する場合のリクエスト数（バックエンドのバッチの上限で分割した数）
+def count_requests(texts):
+    return len(get_backend().plan_chunks(list(enumerate(texts))))
+
+
+# リクエスト数から翻訳の所要時間（秒）を見積もる（並列数とレート制限を考慮）
+def estimate_translation_seconds(request_count):
+    if request_count == 0:
+        return 0.0
+    total, count = metrics.summary("translation_request_seconds")
+    seconds_per_request = total / count if count else ESTIMATED_SECONDS_PER_REQUEST
+    seconds = -(-request_count // max(1, TRANSLATION_WORKERS)) * seconds_per_request
+    # バーストを超えた分はレート制限の間隔で送信される
+    if TRANSLATION_RATE_LIMIT > 0:
+        seconds = max(seconds, max(0, request_count - TRANSLATION_RATE_BURST) / TRANSLATION_RATE_LIMIT)
+    return seconds
+
+
+# 1件のテキストを翻訳（失敗時は例外を送出）
+def translate_one(text, source_lang, target_lang):
+    return get_backend().translate(text, source_lang, target_lang)
+
+
+# 再試行すべきエラーか（429・5xx・接続エラー）
+def is_retryable_error(e):
+    if isinstance(e, (TooManyRequests, RequestError, requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return False
+
+
+# チャンクを翻訳（429/5xxの場合は指数バックオフで再試行）
+def translate_chunk_with_retry(translate_chunk, chunk_texts, source_lang, target_lang):
+    for attempt in range(TRANSLATION_MAX_RETRIES + 1):
+        metrics.inc("translation_api_calls_total")
+        metrics.inc("translation_chars_total", sum(len(text) for text in chunk_texts))
+        started = time.perf_counter()
+        try:
+            translated = translate_chunk(chunk_texts, source_lang, target_lang)
+            metrics.observe("translation_request_seconds", time.perf_counter() - started)
+            return translated
+        except Exception as e:
+            if attempt >= TRANSLATION_MAX_RETRIES or not is_retryable_error(e):
+                raise
+            metrics.inc("translation_retries_total")
+            delay = TRANSLATION_RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.warning(f"翻訳リクエストを{delay:.1f}秒後に再試行します（{attempt + 1}回目）: {e}")
+            time.sleep(delay)
+
+
+# テキストのリストをまとめて翻訳（入力と同じ順序・件数で返す）
+# progress_callbackには翻訳が済んだ件数を渡す
+# tag_handlingを指定した場合、テキストはタグつきのXMLとして扱う（対応するバックエンドのみ）
+# error_callbackには翻訳に失敗して元のテキストのまま返す件数を渡す
+# fallback_callbackには予備の翻訳先（failoverバックエンドの最優先以外）で翻訳したテキストのリストを渡す
+def translate_batch(texts, source_lang, target_lang, progress_callback=None, tag_handling=None, error_callback=None,
+                    fallback_callback=None):
+    results = list(texts)
+
+    # 空のテキストは翻訳せずそのまま返す
+    items = [(i, str(text).strip()) for i, text in enumerate(texts) if text and str(text).strip() != ""]
+    if not items:
+        return results
+
+    # 翻訳メモリに登録済みのテキストはAPIを呼ばずに使う
+    backend = get_backend()
+    memory = get_translation_memory()
+    engine = backend.name
+    if memory is not None:
+        try:
+            found = memory.get_many(engine, source_lang, target_lang, [text for _, text in items])
+        except Exception as e:
+            logger.error(f"翻訳メモリの参照に失敗しました: {e}")
+            found = {}
+        pending = []
+        for i, text in items:
+            key = normalize_text(text)
+            if key in found:
+                results[i] = found[key]
+            else:
+                pending.append((i, text))
+        logger.info(f"翻訳メモリ: ヒット {len(items) - len(pending)}件 / ミス {len(pending)}件")
+        metrics.inc("translation_cache_hits_total", len(items) - len(pending))
+        metrics.inc("translation_cache_misses_total", len(pending))
+        items = pending
+        if not items:
+            return results
+
+    done = len(texts) - len(items)
+    if progress_callback:
+        progress_callback(done)
+
+    # バックエンドの上限に収まるチャンクに分割
+    chunks = backend.plan_chunks(items)
+    translate_chunk = partial(backend.translate_batch, tag_handling=tag_handling)
+
+    logger.info(f"{len(items)}件のテキストを{len(chunks)}回のリクエストで翻訳します（{engine}）")
+
+    # チャンクをスレッドプールで並列に翻訳（結果は元の順序で書き戻す）
+    chunk_texts_list = [[text for _, text in chunk] for chunk in chunks]
+    if TRANSLATION_WORKERS > 1 and len(chunks) > 1:
+        executor = get_executor()
+        futures = [
+            executor.submit(translate_chunk_with_retry, translate_chunk, chunk_texts, source_lang, target_lang)
+            for chunk_texts in chunk_texts_list
+        ]
+    else:
+        futures = None
+
+    learned = []
+    for n, chunk in enumerate(chunks):
+        try:
+            if futures is not None:
+                translated = futures[n].result()
+            else:
+                translated = translate_chunk_with_retry(translate_chunk, chunk_texts_list[n], source_lang, target_lang)
+        except Exception as e:
+            logger.error(f"バッチ翻訳エラー: {e}, 件数: {len(chunk)}")
+            metrics.inc("translation_errors_total")
+            translated = [None] * len(chunk)  # エラーの場合は元のテキストを返す
+            if error_callback:
+                error_callback(len(chunk))
+        # 予備の翻訳先の結果は翻訳メモリに登録しない
+        fallback = getattr(translated, "fallback", False)
+        if fallback:
+            metrics.inc("translation_fallback_texts_total", len(chunk), provider=translated.provider)
+            if fallback_callback:
+                fallback_callback([original for _, original in chunk])
+        for (i, original), result in zip(chunk, translated):
+            if result is None:
+                results[i] = original
+            else:
+                results[i] = str(result)
+                if not fallback:
+                    learned.append((original, results[i]))
+        done += len(chunk)
+        if progress_callback:
+            progress_callback(done)
+
+    # 新しく翻訳した結果を翻訳メモリに登録
+    if memory is not None and learned:
+        try:
+            memory.put_many(engine, source_lang, target_lang, learned)
+        except Exception as e:
+            logger.error(f"翻訳メモリへの登録に失敗しました: {e}")
+    return results